@@ -0,0 +1,126 @@
+"""
+Runs translated statements on an asynchronous MongoDB driver, the
+asynchronous API of pymongo (4.9+) or else motor, without leaving the
+event loop.
+"""
+import asyncio
+import os
+import weakref
+
+from .cursor import Parse, CollectionCall, collection_written, translate_timeouts, write_count
+from .database import NotSupportedError
+
+try:
+    from pymongo import AsyncMongoClient
+except ImportError:
+    try:
+        from motor.motor_asyncio import AsyncIOMotorClient as AsyncMongoClient
+    except ImportError:
+        AsyncMongoClient = None
+
+ROWCOUNT_ATTRS = {
+    'update_many': 'matched_count',
+    'delete_many': 'deleted_count',
+    'bulk_write': 'deleted_count',
+}
+
+# Asynchronous clients belong to the event loop they were first used on,
+# so they are shared per loop and client parameters.
+_clients = weakref.WeakKeyDictionary()
+
+
+class QueryContext:
+    """
+    The part of the DatabaseWrapper read by Parse. Concurrent tasks share
+    the connection of their thread, so query options are held here
+    instead of on the connection.
+    """
+    write_buffer = None
+    in_atomic_block = False
+
+    def __init__(self, connection, options):
+        self.settings_dict = connection.settings_dict
+        self.query_options = options
+
+
+def get_database(connection):
+    if AsyncMongoClient is None:
+        raise NotSupportedError('The asynchronous path needs pymongo 4.9+ or motor')
+
+    params = connection.get_connection_params()
+    name = params.pop('name')
+    key = repr(sorted(params.items()))
+    clients = _clients.setdefault(asyncio.get_running_loop(), {})
+    if key not in clients:
+        clients[key] = AsyncMongoClient(**params)
+    return clients[key][name]
+
+
+def plan(connection, sql, params, options=None):
+    parse = Parse(None, sql, params, QueryContext(connection, options or {}), plan=True)
+    parse.get_mongo_cur()
+    return parse
+
+
+async def execute(connection, sql, params, options=None):
+    """
+    Runs a SELECT, UPDATE or DELETE statement and returns its rows, or the
+    rowcount of a write.
+    """
+    parse = plan(connection, sql, params, options)
+    call = parse.operation
+    if call is None:
+        return None
+
+    database = get_database(connection)
+    with translate_timeouts():
+        result = await call.aexecute(database)
+        if call.method == 'count_documents':
+            return [(result,)]
+        if call.method in ROWCOUNT_ATTRS:
+            await written(connection, call.collection)
+            return write_count(result, ROWCOUNT_ATTRS[call.method])
+
+        rows = []
+        async for doc in result:
+            if parse.return_const is not None:
+                rows.append((parse.return_const,))
+            else:
+                rows.append(parse.parse_result(doc))
+        return rows
+
+
+async def written(connection, table):
+    """
+    Runs collection_written on a thread of the default executor: bumping
+    the version of a pinned table is a blocking pymongo call.
+    """
+    connection.ensure_connection()
+    await asyncio.get_running_loop().run_in_executor(
+        None, collection_written, connection.connection, table, connection.settings_dict)
+
+
+async def count(connection, sql, params, options=None):
+    """
+    Counts the rows a SELECT statement returns, on the server when it is
+    a plain find.
+    """
+    call = plan(connection, sql, params, options).operation
+    if call.method != 'find':
+        return len(await execute(connection, sql, params, options))
+
+    kwargs = {}
+    if 'limit' in call.kwargs:
+        kwargs['limit'] = call.kwargs['limit']
+    call = CollectionCall(call.collection, call.options, 'count_documents',
+                          (call.kwargs.get('filter', {}),), kwargs, call.max_time_ms)
+    with translate_timeouts():
+        return await call.aexecute(get_database(connection))
+
+
+def _reset_after_fork():
+    _clients.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
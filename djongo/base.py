@@ -1,16 +1,82 @@
 from django.db.backends.base.base import BaseDatabaseWrapper
 from django.db.backends.base.client import BaseDatabaseClient
-from django.db.backends.base.creation import BaseDatabaseCreation
 from django.db.utils import Error
+from contextlib import contextmanager
 from .introspection import DatabaseIntrospection
 from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+import logging
+import os
+import threading
 
 from .operations import DatabaseOperations
 from .schema import DatabaseSchemaEditor
-from .cursor import Cursor
+from .creation import DatabaseCreation
+from .cursor import Cursor, WriteBuffer
 from .features import DatabaseFeatures
 from . import database
 
+logger = logging.getLogger(__name__)
+
+# MongoClients shared by all the connections of the process, keyed by
+# their client parameters. Each client holds its own pool and server
+# monitoring threads, so connections must not create one each.
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(params):
+    key = repr(sorted(params.items()))
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = MongoClient(**params)
+    return client
+
+
+def close_clients():
+    """
+    Closes the shared clients, for a clean shutdown of the process.
+    """
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
+
+
+def _reset_after_fork():
+    """
+    Runs in the child of a fork (prefork servers): the clients and the
+    connections inherited from the parent are discarded, then the
+    databases with OPTIONS['PREWARM_ON_FORK'] connect right away, before
+    the worker serves its first request.
+    """
+    global _clients_lock
+    # The lock may have been held by another thread of the parent
+    _clients_lock = threading.Lock()
+    _clients.clear()
+
+    from django.conf import settings
+    if not settings.configured:
+        return
+
+    from django.db import connections
+    for conn in connections.all():
+        if conn.vendor != 'djongo':
+            continue
+        conn.connection = None
+        if conn.settings_dict.get('OPTIONS', {}).get('PREWARM_ON_FORK', False):
+            try:
+                conn.ensure_connection()
+                conn.connection.command('ping')
+            except PyMongoError as e:
+                logger.warning('prewarming database {} failed: {}'.format(conn.alias, e))
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
 
 class DatabaseWrapper(BaseDatabaseWrapper):
 
@@ -63,6 +129,7 @@ class DatabaseWrapper(BaseDatabaseWrapper):
         'endswith': 'LIKE BINARY %s',
         'istartswith': 'LIKE %s',
         'iendswith': 'LIKE %s',
+        'search': 'MATCH %s',
     }
 
     vendor = 'djongo'
@@ -70,13 +137,15 @@ class DatabaseWrapper(BaseDatabaseWrapper):
     Database = database
 
     client_class = BaseDatabaseClient
-    creation_class = BaseDatabaseCreation
+    creation_class = DatabaseCreation
     features_class = DatabaseFeatures
     introspection_class = DatabaseIntrospection
     ops_class = DatabaseOperations
 
     def __init__(self, *args, **kwargs):
         super(DatabaseWrapper, self).__init__(*args, **kwargs)
+        self.write_buffer = None
+        self.query_options = {}
 
     def is_usable(self):
         if self.connection is not None:
@@ -84,39 +153,78 @@ class DatabaseWrapper(BaseDatabaseWrapper):
         return False
 
     def get_connection_params(self):
-        # TODO: Add other parameters here
+        """
+        OPTIONS keys which are not all upper case are MongoClient keyword
+        arguments (maxPoolSize, minPoolSize, maxIdleTimeMS,
+        waitQueueTimeoutMS, compressors, tls, tlsCAFile ...). The upper
+        case ones are djongo settings.
+        """
         settings_dict = {}
 
         settings_dict['name'] = self.settings_dict.get('NAME', 'djongo_test')
         settings_dict['host'] = self.settings_dict.get('HOST', 'localhost')
         settings_dict['port'] = self.settings_dict.get('PORT', 27017)
 
+        for key, value in self.settings_dict.get('OPTIONS', {}).items():
+            if not key.isupper():
+                settings_dict[key] = value
+
         return settings_dict
 
     def get_new_connection(self, settings_dict):
         """
-        This needs to be made more generic to accept
-        other MongoClient parameters.
+        Connections with the same client parameters share one MongoClient.
         """
+        settings_dict = dict(settings_dict)
         name = settings_dict.pop('name')
-        return MongoClient(**settings_dict)[name]
+        return get_client(settings_dict)[name]
 
     def _set_autocommit(self, autocommit):
-        pass
+        """
+        With OPTIONS['BUFFER_WRITES'] set, inserts issued while autocommit
+        is off (i.e. inside atomic()) are queued and sent as bulk writes on
+        commit, inside a session transaction if
+        OPTIONS['BUFFER_TRANSACTION'] is also set. UPDATE and DELETE send
+        the queued inserts and run right away, and are not undone by a
+        rollback.
+        """
+        options = self.settings_dict.get('OPTIONS', {})
+        if autocommit or not options.get('BUFFER_WRITES', False):
+            self.write_buffer = None
+        else:
+            self.write_buffer = WriteBuffer(
+                self.connection, options.get('BUFFER_TRANSACTION', False),
+                self.settings_dict)
 
     def init_connection_state(self):
         pass
 
+    @contextmanager
+    def override_query_options(self, options):
+        """
+        Applies queryset level options (write concern, read concern ...)
+        to the queries executed inside the block.
+        """
+        old_options = self.query_options
+        self.query_options = dict(old_options, **options)
+        try:
+            yield
+        finally:
+            self.query_options = old_options
+
     def create_cursor(self, name=None):
-        return Cursor(self.connection)
+        return Cursor(self.connection, self)
 
     def _close(self):
-        if self.connection:
-            with self.wrap_database_errors:
-                self.connection.client.close()
+        # The client is shared with the other connections, see close_clients
+        pass
 
     def _rollback(self):
-        raise Error
+        if self.write_buffer is None:
+            raise Error
+        self.write_buffer.discard()
 
     def _commit(self):
-        pass
+        if self.write_buffer is not None:
+            with self.wrap_database_errors:
+                self.write_buffer.flush()
@@ -0,0 +1,161 @@
+"""
+Caches the documents returned by translated reads. Entries are keyed by
+the MongoDB operation and the versions of the collections it reads;
+every write to a collection bumps its version, so entries read before
+the write are never served again.
+
+Enabled with the RESULT_CACHE dict of DATABASES OPTIONS, e.g.
+
+    'RESULT_CACHE': {
+        'BACKEND': 'djongo.cache.LocMemResultCache',
+        'TIMEOUT': 60,
+        'MAX_ENTRIES': 1000,
+    }
+
+The other keys are the lower cased arguments of the backend. Models
+opt out with the Meta option cache_results = False, querysets with
+cache_results(False).
+"""
+from collections import OrderedDict
+from django.utils.module_loading import import_string
+import copy
+import hashlib
+import threading
+import time
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_result_cache(settings_dict):
+    """
+    The result cache configured for a database, shared by all of its
+    connections, or None.
+    """
+    config = settings_dict.get('OPTIONS', {}).get('RESULT_CACHE')
+    if not config:
+        return None
+
+    key = repr(sorted(config.items()))
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            kwargs = {name.lower(): value for name, value in config.items() if name != 'BACKEND'}
+            cache = _caches[key] = import_string(config['BACKEND'])(**kwargs)
+    return cache
+
+
+class BaseResultCache:
+
+    def __init__(self, timeout=60):
+        self.timeout = timeout
+
+    def entry_key(self, db_name, key, collections):
+        versions = self.versions(db_name, collections)
+        return '{}:{}'.format(key, versions)
+
+    def versions(self, db_name, collections):
+        raise NotImplementedError
+
+    def bump(self, db_name, collection):
+        raise NotImplementedError
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, docs):
+        raise NotImplementedError
+
+
+class LocMemResultCache(BaseResultCache):
+    """
+    In process cache, evicting the least recently used entries beyond
+    `max_entries`. Documents are copied in and out, so callers changing
+    them do not change the cache.
+    """
+
+    def __init__(self, timeout=60, max_entries=1000):
+        super().__init__(timeout)
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.collection_versions = {}
+
+    def versions(self, db_name, collections):
+        with self.lock:
+            return [self.collection_versions.get((db_name, name), 0) for name in collections]
+
+    def bump(self, db_name, collection):
+        with self.lock:
+            key = (db_name, collection)
+            self.collection_versions[key] = self.collection_versions.get(key, 0) + 1
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, docs = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+        return copy.deepcopy(docs)
+
+    def set(self, key, docs):
+        docs = copy.deepcopy(docs)
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.timeout, docs)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+class DjangoResultCache(BaseResultCache):
+    """
+    Cache stored in a cache of the Django cache framework, shared by the
+    processes using it, as are the collection versions.
+    """
+
+    def __init__(self, alias='default', timeout=60):
+        super().__init__(timeout)
+        self.alias = alias
+
+    @property
+    def cache(self):
+        from django.core.cache import caches
+        return caches[self.alias]
+
+    @staticmethod
+    def version_key(db_name, collection):
+        return 'djongo:version:{}:{}'.format(db_name, collection)
+
+    def versions(self, db_name, collections):
+        keys = [self.version_key(db_name, name) for name in collections]
+        found = self.cache.get_many(keys)
+        versions = []
+        for key in keys:
+            if key not in found:
+                # A version evicted from the cache restarts from the clock,
+                # above any version entries could have been stored under.
+                self.cache.add(key, int(time.time() * 1000), None)
+                found[key] = self.cache.get(key)
+            versions.append(found[key])
+        return versions
+
+    def bump(self, db_name, collection):
+        key = self.version_key(db_name, collection)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            self.cache.add(key, int(time.time() * 1000), None)
+
+    def get(self, key):
+        return self.cache.get(self._hashed(key))
+
+    def set(self, key, docs):
+        self.cache.set(self._hashed(key), docs, self.timeout)
+
+    @staticmethod
+    def _hashed(key):
+        return 'djongo:result:{}'.format(hashlib.sha1(key.encode()).hexdigest())
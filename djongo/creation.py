@@ -0,0 +1,113 @@
+from django.db.backends.base.creation import BaseDatabaseCreation
+from pymongo import IndexModel
+import sys
+
+# Documents per insert_many when copying collections that $out cannot
+# write to (capped and time-series collections).
+COPY_BATCH_SIZE = 1000
+
+
+def index_models(collection):
+    """
+    IndexModels recreating the indexes of `collection`, except the one on _id.
+    """
+    return [IndexModel(list(spec['key'].items()),
+                       **{k: v for k, v in spec.items() if k not in ('key', 'v', 'ns')})
+            for spec in collection.list_indexes()
+            if spec['name'] != '_id_']
+
+
+def copy_database(client, source_name, target_name):
+    """
+    Copies every collection of `source_name` with its options and indexes
+    into `target_name`, on the server.
+    """
+    source = client[source_name]
+    target = client[target_name]
+    for info in source.list_collections():
+        name = info['name']
+        if name.startswith('system.'):
+            continue
+
+        options = dict(info.get('options', {}))
+        if info.get('type') == 'view':
+            target.create_collection(name, **options)
+            continue
+
+        if options:
+            target.create_collection(name, **options)
+            batch = []
+            for doc in source[name].find():
+                batch.append(doc)
+                if len(batch) == COPY_BATCH_SIZE:
+                    target[name].insert_many(batch)
+                    batch = []
+            if batch:
+                target[name].insert_many(batch)
+        else:
+            source[name].aggregate([{'$out': {'db': target_name, 'coll': name}}])
+
+        indexes = index_models(source[name])
+        if indexes:
+            target[name].create_indexes(indexes)
+
+
+class DatabaseCreation(BaseDatabaseCreation):
+    """
+    Creates test databases by dropping and recreating them, or by copying
+    the migrated database named by the TEST['TEMPLATE'] setting so that
+    migrations have nothing left to apply.
+    """
+
+    def _client(self):
+        self.connection.ensure_connection()
+        return self.connection.connection.client
+
+    def _create_test_db(self, verbosity, autoclobber, keepdb=False):
+        test_database_name = self._get_test_db_name()
+        client = self._client()
+
+        if test_database_name in client.list_database_names():
+            if keepdb:
+                return test_database_name
+
+            if not autoclobber:
+                confirm = input(
+                    "Type 'yes' if you would like to try deleting the test "
+                    "database '%s', or 'no' to cancel: " % test_database_name)
+            if autoclobber or confirm == 'yes':
+                if verbosity >= 1:
+                    self.log('Destroying old test database for alias %s...' % (
+                        self._get_database_display_str(verbosity, test_database_name),
+                    ))
+                client.drop_database(test_database_name)
+            else:
+                self.log('Tests cancelled.')
+                sys.exit(1)
+
+        template = self.connection.settings_dict.get('TEST', {}).get('TEMPLATE')
+        if template:
+            if verbosity >= 1:
+                self.log('Copying template database %s...' % template)
+            copy_database(client, template, test_database_name)
+
+        return test_database_name
+
+    def _clone_test_db(self, suffix, verbosity, keepdb=False):
+        source_database_name = self.connection.settings_dict['NAME']
+        target_database_name = self.get_test_db_clone_settings(suffix)['NAME']
+        client = self._client()
+
+        if target_database_name in client.list_database_names():
+            if keepdb:
+                return
+            if verbosity >= 1:
+                self.log('Destroying old test database for alias %s...' % (
+                    self._get_database_display_str(verbosity, target_database_name),
+                ))
+            client.drop_database(target_database_name)
+
+        copy_database(client, source_database_name, target_database_name)
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        self._client().drop_database(test_database_name)
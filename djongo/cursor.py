@@ -1,11 +1,27 @@
 from sqlparse import parse as sql_parse
 from sqlparse import tokens
 from sqlparse.sql import IdentifierList, \
-    Identifier, Parenthesis, Where, Comparison, Token
-from pymongo import ReturnDocument, ASCENDING, DESCENDING
+    Identifier, Parenthesis, Where, Comparison, Token, Operation, Function
+from pymongo import ReturnDocument, ASCENDING, DESCENDING, InsertOne, DeleteMany
+from pymongo.errors import PyMongoError, ExecutionTimeout
+from pymongo.read_concern import ReadConcern
+from pymongo.read_preferences import Primary, PrimaryPreferred, Secondary, \
+    SecondaryPreferred, Nearest
+from pymongo.write_concern import WriteConcern
 from pymongo.cursor import Cursor as PymongoCursor
 from pymongo.command_cursor import CommandCursor as PymongoCommandCursor
+from bson import ObjectId, json_util
+from itertools import groupby
+from django.apps import apps
+from .cache import get_result_cache
+from .database import NotSupportedError, OperationalError
+from .deadline import remaining_ms
+from contextlib import contextmanager
+import copy
+import inspect
 import re
+import threading
+import time
 import logging
 
 logger = logging.getLogger(__name__)
@@ -20,32 +36,566 @@ OPERATOR_MAP = {
 
 OPERATOR_PRECEDENCE = {
     'IN': 1,
+    'MATCH': 1,
     'NOT': 2,
     'AND': 3,
     'OR': 4,
     'generic': 50
 }
 
+# Largest $in list sent in a single DELETE; longer lists are split into
+# several DeleteMany operations of one bulk_write.
+IN_BATCH_SIZE = 10000
+
+READ_PREFERENCES = {
+    'primary': Primary,
+    'primaryPreferred': PrimaryPreferred,
+    'secondary': Secondary,
+    'secondaryPreferred': SecondaryPreferred,
+    'nearest': Nearest,
+}
+
 ORDER_BY_MAP = {
     'ASC': ASCENDING,
     'DESC': DESCENDING
 }
 
+ARITHMETIC_MAP = {
+    '+': '$add',
+    '-': '$subtract',
+    '*': '$multiply',
+    '/': '$divide',
+}
+
+FUNCTION_MAP = {
+    'CONCAT': '$concat',
+    'LOWER': '$toLower',
+    'UPPER': '$toUpper',
+    'ABS': '$abs',
+}
+
 
 class SQLDecodeError(ValueError):
     pass
 
 
+class ArrayUpdate:
+    """
+    Parameter value of an ArrayModelField that carries the incremental
+    changes made to the array alongside its full value. INSERT uses the
+    full value, UPDATE turns the changes into $push, $pull or positional
+    $set when only one kind of change was made, and leaves an unchanged
+    array out.
+    """
+
+    def __init__(self, value, push=None, pull=None, set_at=None):
+        self.value = value
+        self.push = push or []
+        self.pull = pull or []
+        self.set_at = set_at or {}
+
+    def __repr__(self):
+        return repr(self.value)
+
+    @property
+    def unchanged(self):
+        return not (self.push or self.pull or self.set_at)
+
+    def update_ops(self, field):
+        if sum(map(bool, (self.push, self.pull, self.set_at))) != 1:
+            return None
+
+        if self.push:
+            return {'$push': {field: {'$each': self.push}}}
+
+        if self.pull:
+            if len(self.pull) == 1:
+                cond = self.pull[0]
+            else:
+                cond = {'$or': self.pull}
+            return {'$pull': {field: cond}}
+
+        return {'$set': {'{}.{}'.format(field, i): doc
+                         for i, doc in self.set_at.items()}}
+
+
+# Keyword argument setting the server time limit of the reads
+MAX_TIME_KWARGS = {
+    'find': 'max_time_ms',
+    'aggregate': 'maxTimeMS',
+    'count_documents': 'maxTimeMS',
+}
+
+
+@contextmanager
+def translate_timeouts():
+    try:
+        yield
+    except ExecutionTimeout as e:
+        raise OperationalError('Query exceeded its time budget: {}'.format(e)) from e
+
+
+# Rowcount of unacknowledged writes (write concern w=0), whose counts are
+# unknown. Django reads it as a row written, so that save() does not fall
+# back to an INSERT.
+UNACKNOWLEDGED_ROWCOUNT = 1
+
+
+def write_count(result, attr, default=UNACKNOWLEDGED_ROWCOUNT):
+    """
+    The `attr` count of a write result, or `default` if the write was not
+    acknowledged.
+    """
+    if not result.acknowledged:
+        return default
+    return getattr(result, attr)
+
+
+class CollectionCall:
+    """
+    A call of a collection method, as planned by Parse. It is made either
+    with pymongo (execute) or with an asynchronous driver (aexecute).
+
+    `max_time_ms` is passed apart from `kwargs` so that the key of the
+    call does not depend on the time left to the request.
+    """
+
+    def __init__(self, collection, options, method, args=(), kwargs=None, max_time_ms=None):
+        self.collection = collection
+        self.options = options
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.max_time_ms = max_time_ms
+
+    def _call(self, db_con):
+        coll = db_con[self.collection]
+        if self.options:
+            coll = coll.with_options(**self.options)
+        kwargs = self.kwargs
+        if self.max_time_ms is not None:
+            kwargs = dict(kwargs, **{MAX_TIME_KWARGS[self.method]: self.max_time_ms})
+        return getattr(coll, self.method)(*self.args, **kwargs)
+
+    def execute(self, db_con):
+        return self._call(db_con)
+
+    def key(self, db_name):
+        """
+        A string identifying the call on database `db_name`, or None when
+        its arguments cannot be serialized.
+        """
+        try:
+            return json_util.dumps([db_name, self.collection, self.method,
+                                    self.args, self.kwargs,
+                                    sorted((name, repr(option))
+                                           for name, option in self.options.items())])
+        except TypeError:
+            return None
+
+    async def aexecute(self, db_con):
+        result = self._call(db_con)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+
+class ResultCursor:
+    """
+    Documents already fetched, standing in for a pymongo cursor when a
+    result is shared between queries.
+    """
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.index = 0
+
+    @property
+    def alive(self):
+        return self.index < len(self.docs)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.index >= len(self.docs):
+            raise StopIteration
+        doc = self.docs[self.index]
+        self.index += 1
+        return doc
+
+    next = __next__
+
+    def count(self, with_limit_and_skip=False):
+        return len(self.docs)
+
+    def close(self):
+        self.index = len(self.docs)
+
+
+RESULT_CURSORS = (PymongoCursor, PymongoCommandCursor, ResultCursor)
+
+
+class SingleFlight:
+    """
+    Lets concurrent identical reads share a round trip: the first caller
+    of a key runs the query while the others wait for its result. Reads
+    are coalesced with OPTIONS['COALESCE_READS'] or the coalesce_reads
+    Meta option, outside of atomic blocks.
+    """
+
+    class Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, fetch):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = self.Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            # The leader hands its documents to its caller, which may
+            # change them
+            return copy.deepcopy(call.result)
+
+        try:
+            call.result = fetch()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result
+
+
+single_flight = SingleFlight()
+
+# Collection holding the version of every pinned table, bumped by the
+# writes to the table so that other processes notice them.
+PINNED_VERSIONS = '__pinned__'
+
+
+class PinnedTables:
+    """
+    In process copies of small reference tables, pinned with the `pinned`
+    Meta option or listed in OPTIONS['PINNED_TABLES'], which joins are
+    made against on the client instead of with $lookup.
+
+    A copy is dropped when the process writes to its table. Writes of
+    other processes are noticed at the next version check, made at most
+    every OPTIONS['PINNED_CHECK_INTERVAL'] seconds (5 by default).
+    """
+
+    class Table:
+        def __init__(self, version, docs):
+            self.version = version
+            self.docs = docs
+            self.checked = time.monotonic()
+            self.indexes = {}
+
+        def index(self, field):
+            index = self.indexes.get(field)
+            if index is None:
+                index = {}
+                for doc in self.docs:
+                    index.setdefault(doc.get(field), []).append(doc)
+                self.indexes[field] = index
+            return index
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tables = {}
+        self.generations = {}
+
+    def get(self, db_con, name, check_interval=5):
+        key = (db_con.name, name)
+        with self.lock:
+            table = self.tables.get(key)
+            generation = self.generations.get(key, 0)
+        if table is not None and time.monotonic() - table.checked < check_interval:
+            return table
+
+        state = db_con[PINNED_VERSIONS].find_one({'_id': name})
+        version = state['version'] if state is not None else 0
+        if table is not None and table.version == version:
+            table.checked = time.monotonic()
+            return table
+
+        table = self.Table(version, list(db_con[name].find()))
+        with self.lock:
+            # Not kept if the process wrote to the table meanwhile
+            if self.generations.get(key, 0) == generation:
+                self.tables[key] = table
+        return table
+
+    def discard(self, db_name, name):
+        key = (db_name, name)
+        with self.lock:
+            self.tables.pop(key, None)
+            self.generations[key] = self.generations.get(key, 0) + 1
+
+    def written(self, db_con, name):
+        self.discard(db_con.name, name)
+        db_con[PINNED_VERSIONS].update_one({'_id': name}, {'$inc': {'version': 1}}, upsert=True)
+
+
+pinned_tables = PinnedTables()
+
+
+class WriteBuffer:
+    """
+    Queues the INSERT operations issued inside an atomic block and sends
+    them as ordered bulk_write calls on commit, one per run of
+    consecutive operations on the same collection. Reads inside the block
+    do not see the queued writes. UPDATE and DELETE statements, whose
+    rowcount Django reads, flush the queue and run directly.
+
+    Operations are queued with the pymongo collection they target, so
+    the collection's write concern applies unless the flush runs in a
+    transaction. What is cached of the written collections is
+    invalidated once they are flushed, see collection_written.
+    """
+
+    def __init__(self, db_con, use_transaction=False, settings_dict=None):
+        self.db_con = db_con
+        self.use_transaction = use_transaction
+        self.settings_dict = settings_dict or {}
+        self.ops = []
+
+    def add(self, collection, op):
+        self.ops.append((collection, op))
+
+    def discard(self):
+        self.ops = []
+
+    def flush(self):
+        ops, self.ops = self.ops, []
+        if not ops:
+            return
+
+        if not self.use_transaction:
+            try:
+                self._write(ops)
+            finally:
+                self._bump(ops)
+            return
+
+        try:
+            with self.db_con.client.start_session() as session:
+                session.with_transaction(lambda s: self._write(ops, s))
+        finally:
+            self._bump(ops)
+
+    def _bump(self, ops):
+        for name in {coll.name for coll, _ in ops}:
+            collection_written(self.db_con, name, self.settings_dict)
+
+    def _write(self, ops, session=None):
+        for name, coll_ops in groupby(ops, key=lambda op: op[0].name):
+            coll_ops = list(coll_ops)
+            if session is None:
+                coll = coll_ops[0][0]
+            else:
+                coll = self.db_con[name]
+            result = coll.bulk_write(
+                [op for _, op in coll_ops], ordered=True, session=session)
+            if result.acknowledged:
+                logger.debug('bulk_write {}: inserted:{} matched:{} deleted:{}'.format(
+                    name, result.inserted_count, result.matched_count, result.deleted_count))
+
+
+class ChunkedWriter:
+    """
+    Applies an update or delete to the documents matching a filter in
+    batches of `batch_size` _ids, so that a mass write is a series of
+    bounded operations instead of one long running one.
+
+    Batches are throttled to `ops_per_second` documents per second and,
+    on replica sets, paused while the replication lag of the secondaries
+    exceeds `max_replication_lag` seconds. `progress` is called with the
+    number of documents processed so far after every batch.
+    """
+
+    lag_check_interval = 1
+
+    def __init__(self, collection, batch_size=1000, ops_per_second=None,
+                 max_replication_lag=None, progress=None):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.ops_per_second = ops_per_second
+        self.max_replication_lag = max_replication_lag
+        self.progress = progress
+
+    def update(self, filter, update):
+        return self._run(filter, lambda flt: self.collection.update_many(flt, update),
+                         'matched_count')
+
+    def delete(self, filter):
+        return self._run(filter, lambda flt: self.collection.delete_many(flt), 'deleted_count')
+
+    def _run(self, filter, write, count_attr):
+        total = 0
+        last_id = None
+        while True:
+            started = time.monotonic()
+            flt = filter
+            if last_id is not None:
+                flt = {'$and': [filter, {'_id': {'$gt': last_id}}]}
+
+            ids = [doc['_id'] for doc in self.collection.find(flt, {'_id': True})
+                   .sort('_id', ASCENDING).limit(self.batch_size)]
+            if not ids:
+                break
+
+            result = write({'$and': [{'_id': {'$in': ids}}, filter]})
+            # Unacknowledged batches count all the documents they were sent
+            total += write_count(result, count_attr, len(ids))
+            last_id = ids[-1]
+            logger.debug('chunked write on {}: {}'.format(self.collection.name, total))
+            if self.progress is not None:
+                self.progress(total)
+
+            if len(ids) < self.batch_size:
+                break
+            self._throttle(started, len(ids))
+
+        return total
+
+    def _throttle(self, started, count):
+        if self.ops_per_second:
+            delay = count / self.ops_per_second - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+
+        if self.max_replication_lag is not None:
+            while self.replication_lag() > self.max_replication_lag:
+                time.sleep(self.lag_check_interval)
+
+    def replication_lag(self):
+        """
+        Seconds the slowest secondary is behind the primary, 0 when not
+        running against a replica set.
+        """
+        try:
+            status = self.collection.database.client.admin.command('replSetGetStatus')
+        except PyMongoError:
+            return 0
+
+        primary = [m['optimeDate'] for m in status['members'] if m['stateStr'] == 'PRIMARY']
+        secondary = [m['optimeDate'] for m in status['members'] if m['stateStr'] == 'SECONDARY']
+        if not primary or not secondary:
+            return 0
+        return (primary[0] - min(secondary)).total_seconds()
+
+
+_table_meta = None
+
+
+def table_meta(table):
+    """
+    Returns the Options of the installed model stored in `table`, or None.
+    """
+    global _table_meta
+    if _table_meta is None:
+        if not apps.ready:
+            return None
+        _table_meta = {mdl._meta.db_table: mdl._meta
+                       for mdl in apps.get_models(include_auto_created=True)}
+    return _table_meta.get(table)
+
+
+def is_pinned(settings_dict, table):
+    if getattr(table_meta(table), 'pinned', False):
+        return True
+    return table in settings_dict.get('OPTIONS', {}).get('PINNED_TABLES', ())
+
+
+def filter_fields(flt):
+    """
+    Yields the fields a MongoDB filter refers to, within its logical
+    operators too.
+    """
+    for key, value in flt.items():
+        if key in ('$and', '$or', '$nor'):
+            for clause in value:
+                yield from filter_fields(clause)
+        elif not key.startswith('$'):
+            yield key
+
+
+def collection_written(db_con, table, settings_dict):
+    """
+    Invalidates the cached results and the pinned copy of `table` after
+    a write to it.
+    """
+    result_cache = get_result_cache(settings_dict)
+    if result_cache is not None:
+        result_cache.bump(db_con.name, table)
+    if is_pinned(settings_dict, table):
+        pinned_tables.written(db_con, table)
+
+
+def read_preference(value):
+    """
+    Builds a pymongo read preference from a mode name, or from a dict with
+    the `mode` and optionally `max_staleness` (seconds) and `tag_sets`.
+    """
+    if isinstance(value, str):
+        value = {'mode': value}
+
+    mode = READ_PREFERENCES[value['mode']]
+    if mode is Primary:
+        return Primary()
+    return mode(tag_sets=value.get('tag_sets'),
+                max_staleness=value.get('max_staleness', -1))
+
+
+def auto_increment(db_con, collection):
+    """
+    Bumps the `__schema__` sequence of `collection` and returns its auto
+    field entry, or None if the collection has no auto field.
+    """
+    auto = db_con['__schema__'].find_one_and_update({'name': collection},
+                                                    {'$inc': {'auto.seq': 1}},
+                                                    return_document=ReturnDocument.AFTER)
+    if auto:
+        return auto['auto']
+    return None
+
+
 class Parse:
 
-    def __init__(self, connection, sql, params):
+    def __init__(self, connection, sql, params, db_wrapper=None, plan=False):
         self.params = params
         logger.debug('params: {}'.format(params))
         self.p_index = -1
         self.sql = re.sub(r'%s', self.param_index, sql)
         self.connection = connection
+        self.db_wrapper = db_wrapper
+        self.write_buffer = getattr(db_wrapper, 'write_buffer', None)
+        self.plan = plan
+        self.operation = None
+        self.result_cache = None
+        if plan:
+            self.write_buffer = None
+        elif db_wrapper is not None:
+            self.result_cache = get_result_cache(db_wrapper.settings_dict)
         self.left_tb = None
         self.right_tb = []
+        self.text_search = []
 
     def parse_result(self, doc):
         ret_tup = []
@@ -55,10 +605,163 @@ class Parse:
             elif '{}.{}'.format(sql_ob.coll, sql_ob.field) in doc:
                 ret_tup.append(doc['{}.{}'.
                                format(sql_ob.coll, sql_ob.field)])
+            elif isinstance(doc.get(sql_ob.coll), dict) and sql_ob.field in doc[sql_ob.coll]:
+                # Fields of joins are projected as embedded documents
+                ret_tup.append(doc[sql_ob.coll][sql_ob.field])
             else:  # This is possible only because we have not implemented multiple joins.
                 ret_tup.append(None)
         return tuple(ret_tup)
 
+    def _option(self, name, collection):
+        """
+        Resolves a per query option: queryset overrides come first, then
+        the model Meta of `collection`, then DATABASES OPTIONS.
+        """
+        if self.db_wrapper is None:
+            return None
+
+        if name in self.db_wrapper.query_options:
+            return self.db_wrapper.query_options[name]
+
+        meta = table_meta(collection)
+        value = getattr(meta, name, None)
+        if value is not None:
+            return value
+
+        return self.db_wrapper.settings_dict.get('OPTIONS', {}).get(name.upper())
+
+    def _collection(self, name, write=False):
+        coll = self.connection[name]
+        kw = self._collection_options(name, write)
+        if kw:
+            coll = coll.with_options(**kw)
+        return coll
+
+    def _collection_options(self, name, write=False):
+        kw = {}
+        if write:
+            write_concern = self._option('write_concern', name)
+            if write_concern is not None:
+                kw['write_concern'] = WriteConcern(**write_concern)
+        else:
+            read_concern = self._option('read_concern', name)
+            if read_concern is not None:
+                kw['read_concern'] = ReadConcern(read_concern)
+
+            preference = self._option('read_preference', name)
+            if preference is not None:
+                if getattr(self.db_wrapper, 'in_atomic_block', False):
+                    # Reads inside atomic blocks must see their own writes
+                    kw['read_preference'] = Primary()
+                else:
+                    kw['read_preference'] = read_preference(preference)
+
+        return kw
+
+    def _execute(self, collection, method, *args, write=False, **kwargs):
+        """
+        Calls `method` of `collection`. A planned statement (plan=True) only
+        records the call in self.operation, for an asynchronous driver to
+        make, and returns None.
+        """
+        max_time_ms = None
+        if method in MAX_TIME_KWARGS:
+            max_time_ms = self._max_time_ms(collection)
+        self.operation = CollectionCall(collection, self._collection_options(collection, write),
+                                        method, args, kwargs, max_time_ms)
+        if self.plan:
+            return None
+
+        if (method in ('find', 'aggregate')
+                and not getattr(self.db_wrapper, 'in_atomic_block', False)):
+            docs = self._shared_read(collection)
+            if docs is not None:
+                return ResultCursor(docs)
+
+        return self.operation.execute(self.connection)
+
+    def _max_time_ms(self, collection):
+        """
+        Server time limit of a read: the max_time_ms option
+        (OPTIONS['MAX_TIME_MS'] or max_time_ms() of querysets), capped to
+        the time left before the deadline of the request.
+        """
+        max_time_ms = self._option('max_time_ms', collection)
+        remaining = remaining_ms()
+        if remaining is None:
+            return max_time_ms
+        if remaining <= 0:
+            raise OperationalError('Query deadline exceeded')
+        if max_time_ms is None:
+            return remaining
+        return min(max_time_ms, remaining)
+
+    def _shared_read(self, collection):
+        """
+        Reads through the result cache and coalesces concurrent identical
+        reads, when enabled for `collection`. Returns the documents, or None
+        if the read must be made directly.
+        """
+        cache = self.result_cache
+        if cache is not None and self._option('cache_results', collection) is False:
+            cache = None
+        coalesce = self._option('coalesce_reads', collection)
+        if cache is None and not coalesce:
+            return None
+
+        key = self.operation.key(self.connection.name)
+        if key is None:
+            return None
+
+        call = self.operation
+
+        def fetch():
+            if coalesce:
+                return single_flight.do(key, lambda: list(call.execute(self.connection)))
+            return list(call.execute(self.connection))
+
+        if cache is None:
+            return fetch()
+
+        # The versions are read before the query: a write racing with it
+        # bumps them, so its result is stored under a key no longer read.
+        entry_key = cache.entry_key(self.connection.name, key, [collection] + self.right_tb)
+        docs = cache.get(entry_key)
+        if docs is None:
+            docs = fetch()
+            cache.set(entry_key, docs)
+        return docs
+
+    def _where(self, token):
+        """
+        Translates a WHERE clause into a filter document. MongoDB allows a
+        single $text per query, at its top level, so full text conditions
+        are collected while translating and merged into one $text: all the
+        searched terms must match, each as a phrase.
+        """
+        self.text_search = []
+        flt = Op.token_2_op(token, self).to_mongo()
+        terms = []
+        for term in self.text_search:
+            if term not in terms:
+                terms.append(term)
+
+        if len(terms) == 1:
+            flt['$text'] = {'$search': terms[0]}
+        elif terms:
+            flt['$text'] = {'$search': ' '.join('"{}"'.format(term.replace('"', ''))
+                                                for term in terms)}
+        return flt
+
+    def _text_score_sort(self, collection, kwargs):
+        """
+        Sorts full text searches by relevance first when the text_score
+        option is set.
+        """
+        if '$text' not in kwargs.get('filter', {}) or not self._option('text_score', collection):
+            return None
+        return 'text_score', {'$meta': 'textScore'}
+
     def param_index(self, _):
         self.p_index += 1
         return '%({})s'.format(self.p_index)
@@ -78,11 +781,16 @@ class Parse:
             return None
 
         try:
-            return self.FUNC_MAP[sm_type](self, statement)
+            func = self.FUNC_MAP[sm_type]
         except KeyError:
             logger.debug('\n Not implemented {} {}'.format(sm_type, statement))
             raise NotImplementedError('{} command not implemented for SQL {}'.format(sm_type, self.sql))
 
+        result = func(self, statement)
+        if sm_type != 'SELECT' and not self.plan and self.db_wrapper is not None:
+            collection_written(self.connection, self.left_tb, self.db_wrapper.settings_dict)
+        return result
+
     @staticmethod
     def _iter_tok(tok):
         nextid, nexttok = tok.token_next(0)
@@ -91,8 +799,7 @@ class Parse:
             nextid, nexttok = tok.token_next(nextid)
 
     def _update(self, sm):
-        db_con = self.connection
-        kw = {}
+        kw = {'filter': {}}
         next_id, next_tok = sm.token_next(0)
         sql_ob = next(SQLObj.token_2_obj(next_tok, self))
         collection = sql_ob.field
@@ -103,27 +810,239 @@ class Parse:
         if not next_tok.match(tokens.Keyword, 'SET'):
             raise SQLDecodeError('statement:{}'.format(sm))
 
-        upd = {}
         next_id, next_tok = sm.token_next(next_id)
-        for cmp_ob in SQLObj.token_2_obj(next_tok, self):
-            upd[cmp_ob.field] = cmp_ob.rhs_obj
-        kw['update'] = {'$set': upd}
+        kw['update'] = self._update_doc(next_tok)
 
         next_id, next_tok = sm.token_next(next_id)
 
         while next_id:
             if isinstance(next_tok, Where):
-                where_op = Op.token_2_op(next_tok, self)
-                kw['filter'] = where_op.to_mongo()
+                kw['filter'] = self._where(next_tok)
             next_id, next_tok = sm.token_next(next_id)
 
-        result = db_con[collection].update_many(**kw)
-        logger.debug('update_many:{} matched:{}'.format(result.modified_count, result.matched_count))
+        self._check_timeseries_update(collection, kw['update'])
+        self._check_capped_update(collection, kw['update'])
+
+        if self.write_buffer is not None:
+            # Run after the queued writes, for its matched count
+            self.write_buffer.flush()
+
+        chunked = self._option('chunked_writes', collection)
+        if chunked is not None:
+            self._check_not_planned('Chunked writes')
+            writer = ChunkedWriter(self._collection(collection, write=True), **chunked)
+            self.rowcount = writer.update(kw['filter'], kw['update'])
+            return None
+
+        result = self._execute(collection, 'update_many', write=True, **kw)
+        if self.plan:
+            return None
+        self.rowcount = write_count(result, 'matched_count')
+        logger.debug('update_many matched:{}'.format(self.rowcount))
         return None
 
+    def _check_timeseries_update(self, collection, update):
+        """
+        Time-series collections only allow updates of the meta field, with
+        an update document.
+        """
+        meta = table_meta(collection)
+        timeseries = getattr(meta, 'timeseries', None)
+        if timeseries is None:
+            return
+
+        meta_column = None
+        if timeseries.get('meta_field'):
+            meta_column = meta.get_field(timeseries['meta_field']).column
+
+        if isinstance(update, list):
+            columns = [column for stage in update for column in stage['$set']]
+        else:
+            columns = [column for fields in update.values() for column in fields]
+
+        for column in columns:
+            if meta_column is None or (column != meta_column
+                                       and not column.startswith(meta_column + '.')):
+                raise NotSupportedError('Time-series collection {} only supports updating '
+                                        'its meta field, not {}'.format(collection, column))
+        if isinstance(update, list):
+            raise NotSupportedError('Time-series collection {} does not support '
+                                    'update pipelines'.format(collection))
+
+    def _check_capped_update(self, collection, update):
+        """
+        Capped collections only allow in place updates: $set, $inc and $mul
+        are sent, and the server rejects those that change the size of a
+        document.
+        """
+        if getattr(table_meta(collection), 'capped', None) is None:
+            return
+
+        if isinstance(update, list):
+            raise NotSupportedError('Capped collection {} does not support '
+                                    'update pipelines'.format(collection))
+        for operator in update:
+            if operator not in ('$set', '$inc', '$mul'):
+                raise NotSupportedError('Capped collection {} does not support '
+                                        '{} updates'.format(collection, operator))
+
+    def _check_capped_delete(self, collection):
+        """
+        Documents of capped collections are only removed by the server, as
+        newer ones are inserted.
+        """
+        if getattr(table_meta(collection), 'capped', None) is not None:
+            raise NotSupportedError('Documents cannot be deleted from capped '
+                                    'collection {}'.format(collection))
+
+    def _update_doc(self, token):
+        """
+        Translates the SET clause into an update document. Column
+        arithmetic on the updated column itself becomes $inc/$mul so
+        counters are modified atomically on the server; any other
+        expression turns the whole update into an update pipeline.
+        """
+        if isinstance(token, Comparison):
+            comparisons = [token]
+        elif isinstance(token, IdentifierList):
+            comparisons = list(token.get_identifiers())
+        else:
+            raise SQLDecodeError('SET: {}'.format(token))
+
+        upd = {}
+        exprs = {}
+        unchanged = {}
+        use_pipeline = False
+        for cmp_tok in comparisons:
+            if not isinstance(cmp_tok, Comparison):
+                raise SQLDecodeError('SET: {}'.format(cmp_tok))
+
+            field = next(SQLObj.token_2_obj(cmp_tok.left, self)).field
+            if cmp_tok.right.match(tokens.Name.Placeholder, '.*', regex=True):
+                value = next(SQLObj.token_2_obj(cmp_tok.right, self))
+                if isinstance(value, ArrayUpdate):
+                    if value.unchanged:
+                        unchanged[field] = value.value
+                        continue
+                    array_ops = value.update_ops(field)
+                    value = value.value
+                    if array_ops:
+                        exprs[field] = {'$literal': value}
+                        for oper, spec in array_ops.items():
+                            upd.setdefault(oper, {}).update(spec)
+                        continue
+                upd.setdefault('$set', {})[field] = value
+                exprs[field] = {'$literal': value}
+                continue
+
+            expr = self._expr(cmp_tok.right)
+            exprs[field] = expr
+            field_op = self._field_update_op(field, expr)
+            if field_op is None:
+                use_pipeline = True
+            else:
+                oper, value = field_op
+                upd.setdefault(oper, {})[field] = value
+
+        if use_pipeline:
+            return [{'$set': exprs}]
+        if not upd:
+            # Only unchanged arrays were given, rewriting them keeps the
+            # update valid
+            upd['$set'] = unchanged
+        return upd
+
+    @staticmethod
+    def _field_update_op(field, expr):
+        if not (isinstance(expr, dict) and len(expr) == 1):
+            return None
+
+        oper, args = next(iter(expr.items()))
+        if oper not in ('$add', '$subtract', '$multiply') or len(args) != 2:
+            return None
+
+        col = '${}'.format(field)
+        if args[0] == col:
+            other = args[1]
+        elif args[1] == col and oper != '$subtract':
+            other = args[0]
+        else:
+            return None
+
+        if not (isinstance(other, dict) and '$literal' in other):
+            return None
+        value = other['$literal']
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return None
+
+        if oper == '$add':
+            return '$inc', value
+        elif oper == '$subtract':
+            return '$inc', -value
+        else:
+            return '$mul', value
+
+    def _expr(self, token):
+        """
+        Converts an SQL value expression into an aggregation expression.
+        """
+        if isinstance(token, Parenthesis):
+            inner = [tok for tok in token.tokens
+                     if not (tok.is_whitespace or tok.match(tokens.Punctuation, ('(', ')')))]
+            if len(inner) != 1:
+                raise SQLDecodeError('Expression: {}'.format(token))
+            return self._expr(inner[0])
+
+        elif isinstance(token, Operation):
+            operands = [tok for tok in token.tokens if not tok.is_whitespace]
+            expr = self._expr(operands[0])
+            for i in range(1, len(operands), 2):
+                try:
+                    oper = ARITHMETIC_MAP[operands[i].value]
+                except KeyError:
+                    raise SQLDecodeError('Operator: {}'.format(operands[i]))
+                expr = {oper: [expr, self._expr(operands[i + 1])]}
+            return expr
+
+        elif isinstance(token, Function):
+            name = token.tokens[0].value.upper()
+            try:
+                oper = FUNCTION_MAP[name]
+            except KeyError:
+                raise SQLDecodeError('Function: {}'.format(name))
+
+            args = []
+            for tok in token.tokens[-1].tokens:
+                if tok.is_whitespace or tok.match(tokens.Punctuation, ('(', ')')):
+                    continue
+                if isinstance(tok, IdentifierList):
+                    args.extend(self._expr(arg) for arg in tok.get_identifiers())
+                else:
+                    args.append(self._expr(tok))
+            if oper == '$concat':
+                return {oper: args}
+            return {oper: args[0]}
+
+        elif isinstance(token, Identifier):
+            sql_ob = next(SQLObj.token_2_obj(token, self))
+            return '${}'.format(sql_ob.field)
+
+        elif token.match(tokens.Name.Placeholder, '.*', regex=True):
+            return {'$literal': next(SQLObj.token_2_obj(token, self))}
+
+        elif token.match(tokens.Keyword, 'NULL'):
+            return None
+
+        elif token.ttype in tokens.Number.Integer:
+            return {'$literal': int(token.value)}
+
+        elif token.ttype in tokens.Number.Float:
+            return {'$literal': float(token.value)}
+
+        raise SQLDecodeError('Expression: {}'.format(token))
+
     def _delete(self, sm):
-        db_con = self.connection
-        kw = {}
+        kw = {'filter': {}}
         next_id, next_tok = sm.token_next(2)
         sql_ob = next(SQLObj.token_2_obj(next_tok, self))
         collection = sql_ob.field
@@ -131,26 +1050,78 @@ class Parse:
         next_id, next_tok = sm.token_next(next_id)
         while next_id:
             if isinstance(next_tok, Where):
-                where_op = Op.token_2_op(next_tok, self)
-                kw['filter'] = where_op.to_mongo()
+                kw['filter'] = self._where(next_tok)
             next_id, next_tok = sm.token_next(next_id)
 
-        result = db_con[collection].delete_many(**kw)
-        logger.debug('delete_many: {}'.format(result.deleted_count))
+        self._check_capped_delete(collection)
+        filters = self._split_in_filter(kw['filter'], IN_BATCH_SIZE)
+        if self.write_buffer is not None:
+            # Run after the queued writes, for its deleted count
+            self.write_buffer.flush()
+
+        chunked = self._option('chunked_writes', collection)
+        if chunked is not None:
+            self._check_not_planned('Chunked writes')
+            writer = ChunkedWriter(self._collection(collection, write=True), **chunked)
+            self.rowcount = writer.delete(kw['filter'])
+            return
+
+        if len(filters) > 1:
+            result = self._execute(collection, 'bulk_write',
+                                   [DeleteMany(flt) for flt in filters], ordered=False, write=True)
+            if self.plan:
+                return
+            self.rowcount = write_count(result, 'deleted_count')
+            logger.debug('delete in {} batches: {}'.format(len(filters), self.rowcount))
+            return
+
+        result = self._execute(collection, 'delete_many', write=True, **kw)
+        if self.plan:
+            return
+        self.rowcount = write_count(result, 'deleted_count')
+        logger.debug('delete_many: {}'.format(self.rowcount))
+
+    @staticmethod
+    def _split_in_filter(flt, size):
+        """
+        Splits a filter holding an $in list longer than `size` into
+        filters over consecutive chunks of that list.
+        """
+        if list(flt) == ['$and']:
+            terms = flt['$and']
+        else:
+            terms = [flt]
+
+        for i, term in enumerate(terms):
+            if len(term) != 1:
+                continue
+            field, cond = next(iter(term.items()))
+            if not (isinstance(cond, dict) and list(cond) == ['$in']
+                    and len(cond['$in']) > size):
+                continue
+
+            values = cond['$in']
+            return [{'$and': terms[:i] + [{field: {'$in': values[j:j + size]}}] + terms[i + 1:]}
+                    for j in range(0, len(values), size)]
+
+        return [flt]
+
+    def _check_not_planned(self, what):
+        if self.plan:
+            raise NotSupportedError('{} are not supported by the asynchronous path'.format(what))
 
     def _insert(self, sm):
+        self._check_not_planned('INSERT statements')
         db_con = self.connection
         insert = {}
         nextid, nexttok = sm.token_next(2)
         if isinstance(nexttok, Identifier):
             collection = nexttok.get_name()
-            auto = db_con['__schema__'].find_one_and_update({'name': collection} \
-                                                            , {'$inc': {'auto.seq': 1}},
-                                                            return_document=ReturnDocument.AFTER)
+            self.left_tb = collection
+            auto = auto_increment(db_con, collection)
             if auto:
-                auto_field_name = auto['auto']['field_name']
-                auto_field_id = auto['auto']['seq']
-                insert[auto_field_name] = auto_field_id
+                auto_field_id = auto['seq']
+                insert[auto['field_name']] = auto_field_id
             else:
                 auto_field_id = None
         else:
@@ -159,16 +1130,29 @@ class Parse:
         nextid, nexttok = sm.token_next(nextid)
 
         for sql_ob in SQLObj.token_2_obj(nexttok, self):
-            insert[sql_ob.field] = self.params.pop(0)
+            value = self.params.pop(0)
+            if isinstance(value, ArrayUpdate):
+                value = value.value
+            insert[sql_ob.field] = value
 
         if self.params:
             raise SQLDecodeError('unexpected params {}'.format(self.params))
 
-        result = db_con[collection].insert_one(insert)
+        if self.write_buffer is not None:
+            if not auto_field_id:
+                insert['_id'] = ObjectId()
+                auto_field_id = str(insert['_id'])
+            self.write_buffer.add(self._collection(collection, write=True), InsertOne(insert))
+            self.last_row_id = auto_field_id
+            self.rowcount = 1
+            return None
+
+        result = self._collection(collection, write=True).insert_one(insert)
         if not auto_field_id:
             auto_field_id = str(result.inserted_id)
 
         self.last_row_id = auto_field_id
+        self.rowcount = 1
         logger.debug('insert id {}'.format(result.inserted_id))
         return None
 
@@ -180,6 +1164,7 @@ class Parse:
         self.return_const = None
         aggr = False
         pipeline = []
+        joins = []
         next_id, next_tok = sm.token_next(0)
         if next_tok.value == '*':
             kwargs['projection'] = {}
@@ -198,7 +1183,8 @@ class Parse:
             if not isinstance(next_tok, Identifier):
                 raise SQLDecodeError('statement: {}'.format(sm))
 
-            return self.connection[next_tok.value.strip('"')].find().count()
+            collection = next_tok.value.strip('"')
+            return self._execute(collection, 'count_documents', {})
 
         else:
             self.pro = pro = []
@@ -233,17 +1219,16 @@ class Parse:
 
         while next_id:
             if isinstance(next_tok, Where):
-                kwargs['filter'] = {}
-
-                where_op = Op.token_2_op(next_tok, self)
-                kwargs['filter'] = where_op.to_mongo()
+                kwargs['filter'] = self._where(next_tok)
 
             elif next_tok.match(tokens.Keyword, 'LIMIT'):
                 next_id, next_tok = sm.token_next(next_id)
                 kwargs['limit'] = int(next_tok.value)
 
-            elif next_tok.match(tokens.Keyword, 'INNER JOIN'):
+            elif (next_tok.match(tokens.Keyword, 'INNER JOIN')
+                  or next_tok.match(tokens.Keyword, 'LEFT OUTER JOIN')):
                 aggr = True
+                outer = next_tok.match(tokens.Keyword, 'LEFT OUTER JOIN')
 
                 next_id, next_tok = sm.token_next(next_id)
                 sql_ob = next(SQLObj.token_2_obj(next_tok, self))
@@ -261,61 +1246,16 @@ class Parse:
                 else:
                     local_field = join_ob.other_field
                     foreign_field = join_ob.field
+                joins.append((right_tb, local_field, foreign_field, outer))
 
-                lookup = {
-                    '$lookup': {
-                        'from': left_tb,
-                        'localField': local_field,
-                        'foreignField': foreign_field,
-                        'as': right_tb
-                    }
-                }
-                unwind = {'$unwind': {'path': '${}'.format(right_tb)}}
-                pipeline.append(lookup)
-                pipeline.append(unwind)
-
-            elif next_tok.match(tokens.Keyword, 'LEFT OUTER JOIN'):
-                aggr = True
-
-                next_id, next_tok = sm.token_next(next_id)
-                sql_ob = next(SQLObj.token_2_obj(next_tok, self))
-                right_tb = sql_ob.field
-                self.right_tb.append(right_tb)
-                next_id, next_tok = sm.token_next(next_id)
-                if not next_tok.match(tokens.Keyword, 'ON'):
-                    raise SQLDecodeError('statement: {}'.format(sm))
-
-                next_id, next_tok = sm.token_next(next_id)
-                join_ob = next(SQLObj.token_2_obj(next_tok, self))
-                if right_tb == join_ob.other_coll:
-                    local_field = join_ob.field
-                    foreign_field = join_ob.other_field
-                else:
-                    local_field = join_ob.other_field
-                    foreign_field = join_ob.field
-
-                lookup = {
-                    '$lookup': {
-                        'from': left_tb,
-                        'localField': local_field,
-                        'foreignField': foreign_field,
-                        'as': right_tb
-                    }
-                }
-                unwind = {
-                    '$unwind': {
-                        'path': '${}'.format(right_tb),
-                        'preserveNullAndEmptyArrays': True
-                    }
-                }
-                pipeline.append(lookup)
-                pipeline.append(unwind)
-
-            elif next_tok.match(tokens.Keyword, 'ORDER'):
+            elif (next_tok.match(tokens.Keyword, 'ORDER')
+                  or next_tok.match(tokens.Keyword, 'ORDER BY')):
                 kwargs['sort'] = {} if aggr else []
-                next_id, next_tok = sm.token_next(next_id)
-                if not next_tok.match(tokens.Keyword, 'BY'):
-                    raise SQLDecodeError('statement: {}'.format(sm))
+                if next_tok.match(tokens.Keyword, 'ORDER'):
+                    # sqlparse before 0.3 lexes ORDER and BY apart
+                    next_id, next_tok = sm.token_next(next_id)
+                    if not next_tok.match(tokens.Keyword, 'BY'):
+                        raise SQLDecodeError('statement: {}'.format(sm))
 
                 next_id, next_tok = sm.token_next(next_id)
                 for order, sql_ob in SQLObj.token_2_obj(next_tok, self):
@@ -331,7 +1271,40 @@ class Parse:
                 raise SQLDecodeError('statement: {}'.format(sm))
 
             next_id, next_tok = sm.token_next(next_id)
+        text_score = self._text_score_sort(collection, kwargs)
         if aggr:
+            pinned = []
+            for join in joins:
+                if self._pinnable(join, kwargs):
+                    pinned.append(join)
+                    continue
+
+                right_tb, local_field, foreign_field, outer = join
+                pipeline.append({
+                    '$lookup': {
+                        'from': right_tb,
+                        'localField': local_field,
+                        'foreignField': foreign_field,
+                        'as': right_tb
+                    }
+                })
+                unwind = {'path': '${}'.format(right_tb)}
+                if outer:
+                    unwind['preserveNullAndEmptyArrays'] = True
+                pipeline.append({'$unwind': unwind})
+
+            limit = None
+            if any(not outer for _, _, _, outer in pinned):
+                # Inner joins drop rows, so the limit applies after them
+                limit = kwargs.pop('limit', None)
+
+            if 'filter' in kwargs and '$text' in kwargs['filter']:
+                # $text is only allowed in the first stage of a pipeline
+                pipeline.insert(0, {'$match': {'$text': kwargs['filter'].pop('$text')}})
+            if text_score is not None:
+                sort = {text_score[0]: text_score[1]}
+                sort.update(kwargs.get('sort', {}))
+                kwargs['sort'] = sort
             if 'sort' in kwargs:
                 pipeline.append({'$sort': kwargs['sort']})
             if 'filter' in kwargs:
@@ -339,17 +1312,86 @@ class Parse:
             if 'limit' in kwargs:
                 pipeline.append({'$limit': kwargs['limit']})
             if pro:
+                pinned_tbs = [join[0] for join in pinned]
                 spec = {}
                 for sql_ob in pro:
                     if sql_ob.coll == left_tb:
                         spec['{}.{}'.format(sql_ob.coll, sql_ob.field)] = '${}'.format(sql_ob.field)
-                    else:
+                    elif sql_ob.coll not in pinned_tbs:
                         spec['{}.{}'.format(sql_ob.coll, sql_ob.field)] = True
+                for _, local_field, _, _ in pinned:
+                    spec['{}.{}'.format(left_tb, local_field)] = '${}'.format(local_field)
                 spec['_id'] = False
                 pipeline.append({'$project': spec})
-                cur = self.connection[collection].aggregate(pipeline)
-            return self.connection[collection].aggregate(pipeline)
-        return self.connection[collection].find(**kwargs)
+
+            cursor = self._execute(collection, 'aggregate', pipeline)
+            if not pinned:
+                return cursor
+            return ResultCursor(self._hash_join(cursor, left_tb, pinned, limit))
+
+        if text_score is not None:
+            kwargs['sort'] = [text_score] + kwargs.get('sort', [])
+            if 'projection' in kwargs:
+                kwargs['projection'][text_score[0]] = text_score[1]
+        return self._execute(collection, 'find', **kwargs)
+
+    def _pinnable(self, join, kwargs):
+        """
+        Whether `join` can be made on the client: its table is pinned and
+        neither the filter nor the sort, run on the server before it,
+        refer to the table.
+        """
+        right_tb = join[0]
+        if self.plan or self.db_wrapper is None:
+            return False
+        if not is_pinned(self.db_wrapper.settings_dict, right_tb):
+            return False
+
+        prefix = right_tb + '.'
+        sort = kwargs.get('sort', [])
+        if isinstance(sort, dict):
+            sort = sort.items()
+        fields = [field for field, order in sort]
+        fields.extend(filter_fields(kwargs.get('filter', {})))
+        return not any(field.startswith(prefix) for field in fields)
+
+    def _hash_join(self, docs, left_tb, joins, limit=None):
+        """
+        Joins the documents of the aggregation with the pinned copies of
+        the tables of `joins`, producing the documents $lookup and $unwind
+        would have.
+        """
+        interval = self.db_wrapper.settings_dict.get('OPTIONS', {}).get('PINNED_CHECK_INTERVAL', 5)
+        fields = {}
+        for sql_ob in self.pro or []:
+            fields.setdefault(sql_ob.coll, []).append(sql_ob.field)
+
+        rows = list(docs)
+        for right_tb, local_field, foreign_field, outer in joins:
+            index = pinned_tables.get(self.connection, right_tb, interval).index(foreign_field)
+            joined = []
+            for row in rows:
+                if not self.pro:
+                    local = row.get(local_field)
+                elif left_tb in row:
+                    local = row[left_tb].get(local_field)
+                else:
+                    local = row.get('{}.{}'.format(left_tb, local_field))
+                matches = index.get(local, [])
+                if not matches and outer:
+                    joined.append(row)
+                for match in matches:
+                    if self.pro:
+                        match = {field: match.get(field) for field in fields.get(right_tb, [])}
+                    else:
+                        # The rows must not share the documents of the pinned copy
+                        match = copy.deepcopy(match)
+                    joined.append(dict(row, **{right_tb: match}))
+            rows = joined
+
+        if limit is not None:
+            rows = rows[:limit]
+        return rows
 
     FUNC_MAP = {
         'SELECT': _find,
@@ -438,6 +1480,7 @@ class Op:
         self.rhs = rhs
         self.parse = parse
         self.is_not = False
+        self.evaluated = False
         self._op_name = op_name
         self.precedence = OPERATOR_PRECEDENCE[op_name]
 
@@ -480,6 +1523,10 @@ class Op:
                     helper()
                     yield InOp(**kw)
 
+                elif next_tok.match(tokens.Keyword, 'MATCH'):
+                    helper()
+                    yield TextOp(**kw)
+
                 elif next_tok.match(tokens.Keyword, 'NOT'):
                     x, next_not = token.token_next(next_id)
                     if next_not.match(tokens.Keyword, 'IN'):
@@ -518,7 +1565,7 @@ class Op:
                 op_list.append(operator_obj)
                 return
             for i in range(len(op_list)):
-                if operator_obj.precedence > op_list[i].precedence:
+                if operator_obj.precedence < op_list[i].precedence:
                     op_list.insert(i, operator_obj)
                     break
             else:
@@ -531,7 +1578,10 @@ class Op:
 
         while op_list:
             eval_op = op_list.pop(0)
-            eval_op.evaluate()
+            # Parenthesised sub expressions come back already evaluated
+            if not eval_op.evaluated:
+                eval_op.evaluate()
+                eval_op.evaluated = True
         return eval_op
 
     def evaluate(self):
@@ -570,7 +1620,16 @@ class InOp(Op):
         if not isinstance(self.rhs['obj'], Parenthesis):
             raise SQLDecodeError
 
-        self._in = [ob for ob in SQLObj.token_2_obj(self.rhs['obj'], self.parse)]
+        self._in = []
+        seen = set()
+        for ob in SQLObj.token_2_obj(self.rhs['obj'], self.parse):
+            try:
+                if ob in seen:
+                    continue
+                seen.add(ob)
+            except TypeError:
+                pass
+            self._in.append(ob)
 
         self.lhs['obj'] = self
         self.rhs['obj'] = self
@@ -583,6 +1642,39 @@ class InOp(Op):
         return {self.field: {op: self._in}}
 
 
+class TextOp(Op):
+    """
+    `column MATCH %s`, a full text search on the text index of the
+    collection. The condition itself matches everything; the searched
+    term is merged into the $text of the whole query by Parse._where.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs, op_name='MATCH')
+        self.is_not = False
+
+    def evaluate(self):
+        if not (self.lhs and self.lhs['obj']):
+            raise SQLDecodeError
+
+        if not (self.rhs and self.rhs['obj']):
+            raise SQLDecodeError
+
+        if not isinstance(self.lhs['obj'], Identifier):
+            raise SQLDecodeError
+
+        self.term = next(SQLObj.token_2_obj(self.rhs['obj'], self.parse))
+        self.parse.text_search.append(self.term)
+
+        self.lhs['obj'] = self
+        self.rhs['obj'] = self
+
+    def to_mongo(self):
+        if self.is_not:
+            raise SQLDecodeError('Full text search cannot be negated')
+        return {}
+
+
 class NotOp(Op):
     def __init__(self, *args, **kwargs):
         super(NotOp, self).__init__(*args, **kwargs, op_name='NOT')
@@ -704,8 +1796,9 @@ class OrOp(Op):
 
 
 class Cursor():
-    def __init__(self, m_cli_connection):
+    def __init__(self, m_cli_connection, db_wrapper=None):
         self.m_cli_connection = m_cli_connection
+        self.db_wrapper = db_wrapper
         self.mongo_cursor = None
         self.result_ob = None
 
@@ -713,16 +1806,17 @@ class Cursor():
         self.close()
 
     def close(self):
-        if isinstance(self.mongo_cursor, (PymongoCursor, PymongoCommandCursor)):
+        if isinstance(self.mongo_cursor, RESULT_CURSORS):
             self.mongo_cursor.close()
         self.mongo_cursor = None
         self.result_ob = None
 
     def __iter__(self):
-        if isinstance(self.mongo_cursor, (PymongoCursor, PymongoCommandCursor)):
-            yield from self.mongo_cursor
-        else:
-            raise RuntimeError('Iteration over a dead cursor')
+        with translate_timeouts():
+            if isinstance(self.mongo_cursor, RESULT_CURSORS):
+                yield from self.mongo_cursor
+            else:
+                raise RuntimeError('Iteration over a dead cursor')
 
     def __getattr__(self, name):
         try:
@@ -736,27 +1830,28 @@ class Cursor():
             raise
 
     def execute(self, sql, params=None):
-        self.result_ob = Parse(self.m_cli_connection, sql, params)
+        with translate_timeouts():
+            self.result_ob = Parse(self.m_cli_connection, sql, params, self.db_wrapper)
 
-        try:
-            self.mongo_cursor = self.result_ob.get_mongo_cur()
-        except Exception as e:
-            logger.debug(e)
-            raise
+            try:
+                self.mongo_cursor = self.result_ob.get_mongo_cur()
+            except Exception as e:
+                logger.debug(e)
+                raise
 
-        else:
-            if (isinstance(self.mongo_cursor, (PymongoCursor, PymongoCommandCursor))
-                    and self.mongo_cursor.alive
-                    and hasattr(self.mongo_cursor, 'count')):
-                self.rowcount = self.mongo_cursor.count()
             else:
-                self.rowcount = 1
+                if (isinstance(self.mongo_cursor, RESULT_CURSORS)
+                        and self.mongo_cursor.alive
+                        and hasattr(self.mongo_cursor, 'count')):
+                    self.rowcount = self.mongo_cursor.count()
+                else:
+                    self.rowcount = getattr(self.result_ob, 'rowcount', 1)
 
     def _prefetch(self):
         if self.mongo_cursor is None:
             raise RuntimeError('Non existent cursor operation')
 
-        if not isinstance(self.mongo_cursor, (PymongoCursor, PymongoCommandCursor)):
+        if not isinstance(self.mongo_cursor, RESULT_CURSORS):
             return self.mongo_cursor,
 
         if not self.mongo_cursor.alive:
@@ -765,46 +1860,49 @@ class Cursor():
         return None
 
     def fetchmany(self, size=1):
-        ret = self._prefetch()
-        if ret is not None:
+        with translate_timeouts():
+            ret = self._prefetch()
+            if ret is not None:
+                return ret
+
+            if self.result_ob.return_const is not None:
+                return [self.result_ob.return_const] * self.mongo_cursor.count(with_limit_and_skip=True)
+
+            ret = []
+            for i, row in enumerate(self.mongo_cursor):
+                ret.append(self.result_ob.parse_result(row))
+                if i == size - 1:
+                    break
             return ret
 
-        if self.result_ob.return_const is not None:
-            return [self.result_ob.return_const] * self.mongo_cursor.count(with_limit_and_skip=True)
-
-        ret = []
-        for i, row in enumerate(self.mongo_cursor):
-            ret.append(self.result_ob.parse_result(row))
-            if i == size - 1:
-                break
-        return ret
-
     def fetchone(self):
-        ret = self._prefetch()
-        if ret is not None:
-            return ret
+        with translate_timeouts():
+            ret = self._prefetch()
+            if ret is not None:
+                return ret
+
+            if self.result_ob.return_const:
+                try:
+                    self.mongo_cursor.next()
+                except StopIteration:
+                    return []
+                else:
+                    return (self.result_ob.return_const,)
 
-        if self.result_ob.return_const:
-            try:
-                self.mongo_cursor.next()
-            except StopIteration:
-                return []
             else:
-                return (self.result_ob.return_const,)
-
-        else:
-            try:
-                res = self.result_ob.parse_result(self.mongo_cursor.next())
-            except StopIteration:
-                res = []
-            return res
+                try:
+                    res = self.result_ob.parse_result(self.mongo_cursor.next())
+                except StopIteration:
+                    res = []
+                return res
 
     def fetchall(self):
-        ret = self._prefetch()
-        if ret is not None:
-            return ret
-
-        if self.result_ob.return_const is not None:
-            return [self.result_ob.return_const] * self.mongo_cursor.count(with_limit_and_skip=True)
-        return [self.result_ob.parse_result(row) for row in self.mongo_cursor]
+        with translate_timeouts():
+            ret = self._prefetch()
+            if ret is not None:
+                return ret
+
+            if self.result_ob.return_const is not None:
+                return [self.result_ob.return_const] * self.mongo_cursor.count(with_limit_and_skip=True)
+            return [self.result_ob.parse_result(row) for row in self.mongo_cursor]
 
@@ -0,0 +1,54 @@
+"""
+Time budgets of the queries made while serving a request. Inside
+deadline(seconds), the maxTimeMS of every read is capped to the time
+left, so queries stop on the server once the request gave up on them.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+import time
+
+_deadline = ContextVar('djongo_deadline', default=None)
+
+
+@contextmanager
+def deadline(seconds):
+    """
+    Runs the block within `seconds`, or within the deadline of an
+    enclosing block if it comes first.
+    """
+    at = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None:
+        at = min(at, current)
+    token = _deadline.set(at)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_ms():
+    """
+    Milliseconds left before the current deadline, or None outside of
+    deadline blocks.
+    """
+    at = _deadline.get()
+    if at is None:
+        return None
+    return int((at - time.monotonic()) * 1000)
+
+
+class DeadlineMiddleware:
+    """
+    Serves each request within settings.DJONGO_REQUEST_TIMEOUT seconds
+    (30 by default), the timeout of the server in front of Django.
+    """
+
+    def __init__(self, get_response):
+        from django.conf import settings
+        self.get_response = get_response
+        self.timeout = getattr(settings, 'DJONGO_REQUEST_TIMEOUT', 30)
+
+    def __call__(self, request):
+        with deadline(self.timeout):
+            return self.get_response(request)
@@ -3,3 +3,6 @@ from django.db.backends.base.features import BaseDatabaseFeatures
 
 class DatabaseFeatures(BaseDatabaseFeatures):
     supports_transactions = False
+    uses_savepoints = False
+    # Deletes over joins are done with a list of pks, not a subquery
+    update_can_self_select = False
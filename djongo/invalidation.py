@@ -0,0 +1,204 @@
+from django.db import connections
+from pymongo.errors import OperationFailure, PyMongoError
+import logging
+import threading
+import time
+
+from .cache import DjangoResultCache, get_result_cache
+from .cursor import pinned_tables
+
+logger = logging.getLogger(__name__)
+
+# Collection of the last saved resume token of each invalidator, one
+# {'_id': name, 'token': token} document per invalidator name
+RESUME_TOKENS = '__resume_tokens__'
+
+# Server error code of a resume token no longer in the oplog
+CHANGE_STREAM_HISTORY_LOST = 286
+
+WATCHED_OPERATIONS = ['insert', 'update', 'replace', 'delete', 'drop', 'rename',
+                      'dropDatabase', 'invalidate']
+
+
+class ChangeStreamInvalidator:
+    """
+    Tails the change stream of the `collections` of a database (all of
+    them by default) in a background thread and publishes every change,
+    made by any process, as an invalidation of (collection, document ids):
+
+    - to the callbacks added with register(), called with the collection
+      name and the list of changed _ids, or None when the whole collection
+      changed (drop, rename, dropped database, lost history);
+    - to the collection version keys of the `cache_alias` Django cache,
+      the ones DjangoResultCache reads;
+    - to the result cache of the database, if it has one, and to the
+      pinned copies of the tables.
+
+    The resume token of the last published change is stored under `name`
+    every `save_every` changes or `save_interval` seconds, and when the
+    stream closes, so a restarted invalidator resumes where it stopped,
+    publishing again at most the changes made since the last save.
+    Change streams need a replica set, a single node one will do.
+    """
+
+    def __init__(self, using='default', collections=None, cache_alias=None,
+                 name='default', max_await_time_ms=1000, retry_interval=5,
+                 save_every=100, save_interval=5):
+        self.using = using
+        self.collections = collections
+        self.cache_alias = cache_alias
+        self.name = name
+        self.max_await_time_ms = max_await_time_ms
+        self.retry_interval = retry_interval
+        self.save_every = save_every
+        self.save_interval = save_interval
+        self.callbacks = []
+        self.stopped = threading.Event()
+        self.thread = None
+        # Collections of the database when watching all of them, the
+        # ones to invalidate when it is dropped
+        self.known = set()
+        self.token = None
+        self.unsaved = 0
+        self.saved_at = time.monotonic()
+
+    @property
+    def db(self):
+        connection = connections[self.using]
+        connection.ensure_connection()
+        return connection.connection
+
+    def register(self, callback):
+        self.callbacks.append(callback)
+        return callback
+
+    def start(self):
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, name='djongo-invalidator-{}'.format(self.name),
+                                       daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=None):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def run(self):
+        """
+        Publishes the changes until stop(), reopening the stream after
+        errors.
+        """
+        while not self.stopped.is_set():
+            try:
+                self._watch()
+            except OperationFailure as e:
+                if e.code != CHANGE_STREAM_HISTORY_LOST:
+                    logger.warning('change stream {} failed: {}'.format(self.name, e))
+                    self.stopped.wait(self.retry_interval)
+                    continue
+                # Changes were missed, everything watched is stale
+                logger.warning('change stream {} lost its history, restarting'.format(self.name))
+                self.save_token(None)
+                for collection in self.collections or self.db.list_collection_names():
+                    self.publish(collection, None)
+            except PyMongoError as e:
+                logger.warning('change stream {} failed: {}'.format(self.name, e))
+                self.stopped.wait(self.retry_interval)
+            finally:
+                connections[self.using].close()
+
+    def _watch(self):
+        match = {'operationType': {'$in': WATCHED_OPERATIONS}}
+        if self.collections is not None:
+            collections = list(self.collections)
+            match['$or'] = [
+                {'ns.coll': {'$in': collections}},
+                {'to.coll': {'$in': collections}},
+                {'operationType': {'$in': ['dropDatabase', 'invalidate']}},
+            ]
+        else:
+            # Saving the tokens must not produce changes to publish
+            match['ns.coll'] = {'$ne': RESUME_TOKENS}
+            self.known = set(self.db.list_collection_names()) - {RESUME_TOKENS}
+
+        try:
+            with self.db.watch([{'$match': match}], resume_after=self.load_token(),
+                               max_await_time_ms=self.max_await_time_ms) as stream:
+                while not self.stopped.is_set() and stream.alive:
+                    change = stream.try_next()
+                    if change is not None:
+                        self.handle(change)
+                    elif self.unsaved and self._save_due():
+                        self.flush_token()
+        finally:
+            self.flush_token()
+
+    def handle(self, change):
+        operation = change['operationType']
+        if operation == 'invalidate':
+            # The stream of a dropped database cannot be resumed
+            self.unsaved = 0
+            self.save_token(None)
+            return
+
+        if operation == 'dropDatabase':
+            for collection in self.collections or sorted(self.known):
+                self.publish(collection, None)
+            self.known.clear()
+        elif operation in ('drop', 'rename'):
+            self.publish(change['ns']['coll'], None)
+            self.known.discard(change['ns']['coll'])
+            if operation == 'rename':
+                self.publish(change['to']['coll'], None)
+                self.known.add(change['to']['coll'])
+        else:
+            self.publish(change['ns']['coll'], [change['documentKey']['_id']])
+            self.known.add(change['ns']['coll'])
+
+        self.token = change['_id']
+        self.unsaved += 1
+        if self._save_due():
+            self.flush_token()
+
+    def _save_due(self):
+        return (self.unsaved >= self.save_every
+                or time.monotonic() - self.saved_at >= self.save_interval)
+
+    def flush_token(self):
+        """
+        Saves the token of the last published change, if not saved yet.
+        """
+        if self.unsaved:
+            self.save_token(self.token)
+            self.unsaved = 0
+        self.saved_at = time.monotonic()
+
+    def publish(self, collection, ids):
+        db_name = self.db.name
+        result_cache = get_result_cache(connections[self.using].settings_dict)
+        if result_cache is not None:
+            result_cache.bump(db_name, collection)
+        pinned_tables.discard(db_name, collection)
+
+        if self.cache_alias is not None:
+            DjangoResultCache(self.cache_alias).bump(db_name, collection)
+
+        for callback in self.callbacks:
+            try:
+                callback(collection, ids)
+            except Exception:
+                logger.exception('invalidation callback {} failed'.format(callback))
+
+    def load_token(self):
+        state = self.db[RESUME_TOKENS].find_one({'_id': self.name})
+        if state is None:
+            return None
+        return state['token']
+
+    def save_token(self, token):
+        self.db[RESUME_TOKENS].update_one(
+            {'_id': self.name},
+            {'$set': {'token': token}},
+            upsert=True
+        )
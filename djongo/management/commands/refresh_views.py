@@ -0,0 +1,34 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from djongo.materialized import MaterializedView, materialized_views
+
+
+class Command(BaseCommand):
+    help = 'Refreshes the collections of the materialized view models.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', metavar='app_label.ModelName',
+                            help='Views to refresh, all of them by default.')
+        parser.add_argument('--full', action='store_true',
+                            help='Rebuild the views instead of aggregating the '
+                                 'source documents added since the last refresh.')
+
+    def handle(self, *args, **options):
+        if options['models']:
+            models = []
+            for label in options['models']:
+                try:
+                    model = apps.get_model(label)
+                except (LookupError, ValueError) as e:
+                    raise CommandError(str(e))
+                if getattr(model._meta, 'materialized_view', None) is None:
+                    raise CommandError('{} is not a materialized view'.format(label))
+                models.append(model)
+        else:
+            models = materialized_views()
+
+        for model in models:
+            watermark = MaterializedView(model).refresh(full=options['full'])
+            if options['verbosity'] >= 1:
+                self.stdout.write('Refreshed {} up to {}'.format(model._meta.label, watermark))
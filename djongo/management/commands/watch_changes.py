@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from djongo.invalidation import ChangeStreamInvalidator
+
+
+class Command(BaseCommand):
+    help = 'Publishes the changes of the database as cache invalidations, until interrupted.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('collections', nargs='*',
+                            help='Collections to watch, all of them by default.')
+        parser.add_argument('--database', default='default',
+                            help='Database to watch, "default" by default.')
+        parser.add_argument('--cache', dest='cache_alias',
+                            help='Django cache whose collection version keys are bumped.')
+        parser.add_argument('--name', default='default',
+                            help='Name the resume token is stored under.')
+
+    def handle(self, *args, **options):
+        invalidator = ChangeStreamInvalidator(
+            using=options['database'],
+            collections=options['collections'] or None,
+            cache_alias=options['cache_alias'],
+            name=options['name'],
+        )
+        if options['verbosity'] >= 2:
+            invalidator.register(lambda collection, ids: self.stdout.write(
+                'Invalidated {} {}'.format(collection, ids if ids is not None else 'all')))
+        try:
+            invalidator.run()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,115 @@
+from django.apps import apps
+from django.db import connections, router
+from pymongo import ASCENDING, DESCENDING
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Collection holding the refresh watermark of every materialized view,
+# kept apart from __schema__ which only holds auto field counters.
+WATERMARKS = '__views__'
+
+
+class MaterializedView:
+    """
+    Refreshes the collection of an unmanaged model declared as a
+    materialized view with the `materialized_view` Meta option, a dict of:
+
+    source: label ('app_label.ModelName') of the model aggregated
+    pipeline: aggregation pipeline run on the source collection
+    on: key or list of keys identifying a view document, by default '_id'
+    watermark: optional source field name, only increasing (a creation
+        date, an auto id), enabling incremental refreshes
+    when_matched: $merge whenMatched of incremental refreshes, by default
+        'replace'. Aggregates summed over new source documents need a
+        pipeline adding to the existing values instead.
+
+    A full refresh replaces the whole collection with $out. An incremental
+    refresh only aggregates the source documents whose watermark field is
+    above the one of the previous refresh and $merges the result.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.options = model._meta.materialized_view
+        self.source = apps.get_model(self.options['source'])
+        self.connection = connections[router.db_for_read(model)]
+
+    @property
+    def db(self):
+        self.connection.ensure_connection()
+        return self.connection.connection
+
+    @property
+    def on(self):
+        on = self.options.get('on', '_id')
+        if isinstance(on, str):
+            return [on]
+        return list(on)
+
+    def watermark_column(self):
+        if not self.options.get('watermark'):
+            return None
+        return self.source._meta.get_field(self.options['watermark']).column
+
+    def refresh(self, full=False):
+        """
+        Refreshes the view, incrementally when it has a watermark field
+        and a previous refresh, unless `full`. Returns the new watermark.
+        """
+        table = self.model._meta.db_table
+        column = self.watermark_column()
+        last = None
+        if column is not None and not full:
+            state = self.db[WATERMARKS].find_one({'_id': table})
+            if state is not None:
+                last = state['watermark']
+
+        current = None
+        if column is not None:
+            latest = self.db[self.source._meta.db_table].find_one(
+                {column: {'$ne': None}},
+                {column: True},
+                sort=[(column, DESCENDING)]
+            )
+            if latest is None:
+                return last
+            current = latest[column]
+            if last is not None and current <= last:
+                return last
+
+        pipeline = list(self.options['pipeline'])
+        if last is None:
+            if current is not None:
+                pipeline.insert(0, {'$match': {column: {'$lte': current}}})
+            pipeline.append({'$out': table})
+        else:
+            pipeline.insert(0, {'$match': {column: {'$gt': last, '$lte': current}}})
+            pipeline.append({'$merge': {
+                'into': table,
+                'on': self.on,
+                'whenMatched': self.options.get('when_matched', 'replace'),
+                'whenNotMatched': 'insert'
+            }})
+
+        if self.on != ['_id']:
+            # $merge requires a unique index on its `on` keys; $out keeps
+            # the indexes of the collection it replaces.
+            self.db[table].create_index([(key, ASCENDING) for key in self.on],
+                                        unique=True)
+        self.db[self.source._meta.db_table].aggregate(pipeline, allowDiskUse=True)
+        logger.debug('refreshed {} up to {}'.format(table, current))
+
+        if column is not None:
+            self.db[WATERMARKS].update_one({'_id': table},
+                                           {'$set': {'watermark': current}},
+                                           upsert=True)
+        return current
+
+
+def materialized_views():
+    """
+    The installed models declared as materialized views.
+    """
+    return [model for model in apps.get_models()
+            if getattr(model._meta, 'materialized_view', None) is not None]
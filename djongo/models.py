@@ -1,9 +1,38 @@
 from django.db.models import *
 from django import forms
-from django.core.exceptions import ValidationError
-from django.db import connection
+from django.core.exceptions import ValidationError, EmptyResultSet, FieldError
+from django.db import connection, connections, router
+from django.db.models import options
+from django.db.models.lookups import BuiltinLookup
+from django.db.models.constants import LOOKUP_SEP
+from django.db.models.query import ModelIterable, prefetch_related_objects
+from django.db.models.sql import UpdateQuery
+from django.db.models.signals import post_save
+from pymongo import ReturnDocument, ASCENDING, DESCENDING, HASHED, TEXT, GEOSPHERE
+from pymongo.collation import Collation
+from pymongo.write_concern import WriteConcern
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import copy
 import typing
 
+from . import asynchronous
+from .cursor import ArrayUpdate, auto_increment, collection_written
+from .database import NotSupportedError
+
+# Model Meta options understood by djongo
+options.DEFAULT_NAMES = options.DEFAULT_NAMES + (
+    'write_concern',
+    'read_concern',
+    'read_preference',
+    'coalesce_reads',
+    'cache_results',
+    'pinned',
+    'timeseries',
+    'capped',
+    'materialized_view',
+)
+
 def make_mdl(mdl, mdl_dict):
     for field_name in mdl_dict:
         field = mdl._meta.get_field(field_name)
@@ -17,7 +46,483 @@ def useful_field(field):
                                    or isinstance(field, (AutoField, BigAutoField)))
 
 
-class DjongoManager(Manager):
+@CharField.register_lookup
+@TextField.register_lookup
+class SearchLookup(BuiltinLookup):
+    """
+    `field__search=terms`, a MongoDB full text search. It needs a text
+    index on the collection, declared with MongoIndex(index_type='text').
+    Admin search_fields prefixed with '@' use this lookup.
+    """
+    lookup_name = 'search'
+
+
+class MongoIndex(Index):
+    """
+    Index with the MongoDB specific options, for use in Meta.indexes.
+
+    index_type is one of 'hashed', 'text', '2dsphere' or 'wildcard'.
+    Fields may be embedded paths like 'comments.text' (the index then
+    needs a name); a wildcard index covers every path below each of its
+    fields. partial_filter is a MongoDB query document,
+    expire_after_seconds makes a TTL index on a single date field and
+    collation is a dict of pymongo Collation arguments.
+    """
+    index_types = {
+        'hashed': HASHED,
+        'text': TEXT,
+        '2dsphere': GEOSPHERE,
+        'wildcard': ASCENDING,
+    }
+
+    def __init__(self, *, fields=(), name=None, index_type=None, unique=False,
+                 sparse=False, partial_filter=None, expire_after_seconds=None,
+                 collation=None, weights=None, **kwargs):
+        if index_type is not None and index_type not in self.index_types:
+            raise ValueError('MongoIndex.index_type must be one of {}.'
+                             .format(', '.join(sorted(self.index_types))))
+        if expire_after_seconds is not None and len(fields) != 1:
+            raise ValueError('A TTL index must be on a single field.')
+        if not name and any('.' in field or '$' in field for field in fields):
+            raise ValueError('An index on embedded paths must be named.')
+
+        super().__init__(fields=fields, name=name, **kwargs)
+        self.index_type = index_type
+        self.unique = unique
+        self.sparse = sparse
+        self.partial_filter = partial_filter
+        self.expire_after_seconds = expire_after_seconds
+        self.collation = collation
+        self.weights = weights
+
+    def deconstruct(self):
+        path, args, kwargs = super().deconstruct()
+        for attr, default in (('index_type', None),
+                              ('unique', False),
+                              ('sparse', False),
+                              ('partial_filter', None),
+                              ('expire_after_seconds', None),
+                              ('collation', None),
+                              ('weights', None)):
+            value = getattr(self, attr)
+            if value != default:
+                kwargs[attr] = value
+        return path, args, kwargs
+
+    def mongo_keys(self, model):
+        keys = []
+        for field_name, order in self.fields_orders:
+            path = field_name.split('.')
+            if path[0] != '$**':
+                path[0] = model._meta.get_field(path[0]).column
+            if self.index_type == 'wildcard' and path[-1] != '$**':
+                path.append('$**')
+
+            if self.index_type is not None:
+                direction = self.index_types[self.index_type]
+            else:
+                direction = DESCENDING if order == 'DESC' else ASCENDING
+            keys.append(('.'.join(path), direction))
+
+        return keys
+
+    def mongo_options(self):
+        kwargs = {}
+        if self.unique:
+            kwargs['unique'] = True
+        if self.sparse:
+            kwargs['sparse'] = True
+        if self.partial_filter is not None:
+            kwargs['partialFilterExpression'] = self.partial_filter
+        if self.expire_after_seconds is not None:
+            kwargs['expireAfterSeconds'] = self.expire_after_seconds
+        if self.collation is not None:
+            kwargs['collation'] = Collation(**self.collation)
+        if self.weights is not None:
+            kwargs['weights'] = self.weights
+        return kwargs
+
+
+class DjongoQuerySet(QuerySet):
+    """
+    QuerySet carrying MongoDB specific query options, which are applied
+    to the queries it executes.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._mongo_options = {}
+
+    def _clone(self, **kwargs):
+        clone = super()._clone(**kwargs)
+        clone._mongo_options = dict(self._mongo_options)
+        return clone
+
+    def _with_mongo_options(self, **kwargs):
+        clone = self._clone()
+        clone._mongo_options.update(kwargs)
+        return clone
+
+    @contextmanager
+    def _mongo_context(self, for_write=False):
+        if not self._mongo_options:
+            yield
+            return
+
+        if self._db:
+            using = self._db
+        elif for_write:
+            using = router.db_for_write(self.model, **self._hints)
+        else:
+            using = router.db_for_read(self.model, **self._hints)
+
+        with connections[using].override_query_options(self._mongo_options):
+            yield
+
+    def using_write_concern(self, **kwargs):
+        """
+        Write concern (w, j, wtimeout) for writes made through this
+        queryset, e.g. using_write_concern(w=0) for fire-and-forget.
+        """
+        return self._with_mongo_options(write_concern=kwargs)
+
+    def using_read_concern(self, level):
+        """
+        Read concern level ('local', 'majority' ...) for reads made
+        through this queryset.
+        """
+        return self._with_mongo_options(read_concern=level)
+
+    def using_read_preference(self, mode, max_staleness=-1, tag_sets=None):
+        """
+        Read preference ('primary', 'primaryPreferred', 'secondary',
+        'secondaryPreferred' or 'nearest') for reads made through this
+        queryset outside of atomic blocks.
+        """
+        return self._with_mongo_options(read_preference={
+            'mode': mode,
+            'max_staleness': max_staleness,
+            'tag_sets': tag_sets,
+        })
+
+    def chunked(self, batch_size=1000, ops_per_second=None,
+                max_replication_lag=None, progress=None):
+        """
+        Runs update() and delete() in batches of `batch_size` documents,
+        throttled to `ops_per_second` and paused while the replication
+        lag exceeds `max_replication_lag` seconds. `progress` is called
+        with the number of documents processed after every batch.
+        """
+        return self._with_mongo_options(chunked_writes={
+            'batch_size': batch_size,
+            'ops_per_second': ops_per_second,
+            'max_replication_lag': max_replication_lag,
+            'progress': progress,
+        })
+
+    def order_by_text_score(self):
+        """
+        Orders the results of a `__search` query by relevance, before any
+        other ordering.
+        """
+        return self._with_mongo_options(text_score=True)
+
+    def max_time_ms(self, milliseconds):
+        """
+        Server time limit of the reads made through this queryset,
+        overriding OPTIONS['MAX_TIME_MS']. None removes the limit.
+        """
+        return self._with_mongo_options(max_time_ms=milliseconds)
+
+    def cache_results(self, enabled=True):
+        """
+        Reads through the result cache of OPTIONS['RESULT_CACHE'], or
+        bypasses it with enabled=False.
+        """
+        return self._with_mongo_options(cache_results=enabled)
+
+    def parallel_prefetch(self, max_workers=4):
+        """
+        Runs the prefetch_related lookups of independent relations
+        concurrently on up to `max_workers` threads. OPTIONS
+        ['PARALLEL_PREFETCH'] sets this for every queryset of a database.
+        """
+        return self._with_mongo_options(parallel_prefetch=max_workers)
+
+    def _fetch_all(self):
+        with self._mongo_context():
+            super()._fetch_all()
+
+    def _prefetch_related_objects(self):
+        workers = self._mongo_options.get('parallel_prefetch')
+        if workers is None:
+            workers = connections[self.db].settings_dict.get('OPTIONS', {}).get('PARALLEL_PREFETCH')
+
+        # Lookups through the same first relation depend on each other
+        groups = {}
+        for lookup in self._prefetch_related_lookups:
+            through = getattr(lookup, 'prefetch_through', lookup)
+            groups.setdefault(through.split(LOOKUP_SEP)[0], []).append(lookup)
+
+        if (not workers or len(groups) < 2
+                or connections[self.db].in_atomic_block
+                or not all(isinstance(obj, Model) for obj in self._result_cache)):
+            return super()._prefetch_related_objects()
+
+        # Create the caches the threads write to beforehand, so they do
+        # not race to create them.
+        for obj in self._result_cache:
+            if not hasattr(obj, '_prefetched_objects_cache'):
+                obj._prefetched_objects_cache = {}
+            if 'fields_cache' not in vars(obj._state):
+                obj._state.fields_cache = {}
+
+        with ThreadPoolExecutor(max_workers=min(workers, len(groups))) as executor:
+            futures = [executor.submit(_prefetch_group, self._result_cache, lookups)
+                       for lookups in groups.values()]
+            for future in futures:
+                future.result()
+        self._prefetch_done = True
+
+    def count(self):
+        with self._mongo_context():
+            return super().count()
+
+    def exists(self):
+        with self._mongo_context():
+            return super().exists()
+
+    def aggregate(self, *args, **kwargs):
+        with self._mongo_context():
+            return super().aggregate(*args, **kwargs)
+
+    def update(self, **kwargs):
+        with self._mongo_context(for_write=True):
+            return super().update(**kwargs)
+    update.alters_data = True
+
+    def delete(self):
+        with self._mongo_context(for_write=True):
+            return super().delete()
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def bulk_create(self, *args, **kwargs):
+        with self._mongo_context(for_write=True):
+            return super().bulk_create(*args, **kwargs)
+
+    def create(self, **kwargs):
+        with self._mongo_context(for_write=True):
+            return super().create(**kwargs)
+
+    def get_or_create(self, defaults=None, **kwargs):
+        with self._mongo_context(for_write=True):
+            return super().get_or_create(defaults, **kwargs)
+
+    def update_or_create(self, defaults=None, **kwargs):
+        with self._mongo_context(for_write=True):
+            return super().update_or_create(defaults, **kwargs)
+
+    def upsert(self, defaults=None, **kwargs):
+        """
+        Like update_or_create, but done with a single
+        find_one_and_update(upsert=True). Returns (obj, created).
+
+        The keyword arguments are exact field names; `__` lookups are
+        not supported. On models with an auto primary key, the key of a
+        possible insert is reserved from the `__schema__` counter first,
+        like a sequence value in an SQL INSERT ... ON CONFLICT: an upsert
+        that updates leaves a gap in the sequence. Model signals are not
+        sent. The write concern of the queryset or model applies; an
+        unacknowledged upsert always reports created=True.
+        """
+        return self._upsert(kwargs, defaults or {}, update=True)
+
+    def get_or_upsert(self, defaults=None, **kwargs):
+        """
+        Like get_or_create, but done with a single
+        find_one_and_update(upsert=True). Returns (obj, created). See
+        upsert() for the lookups and auto primary keys.
+        """
+        return self._upsert(kwargs, defaults or {}, update=False)
+
+    def _upsert(self, lookup, defaults, update):
+        using = self._db or router.db_for_write(self.model)
+        conn = connections[using]
+        conn.ensure_connection()
+        db_con = conn.connection
+        opts = self.model._meta
+
+        for name in lookup:
+            if LOOKUP_SEP in name:
+                raise FieldError('upsert() lookups must be exact field names, not {}'.format(name))
+
+        params = dict(lookup)
+        params.update(defaults)
+        obj = self.model(**params)
+
+        flt = {}
+        for name in lookup:
+            field = opts.pk if name == 'pk' else opts.get_field(name)
+            flt[field.column] = field.get_db_prep_save(getattr(obj, field.attname), conn)
+
+        set_doc = {}
+        if update:
+            for field in opts.concrete_fields:
+                if field.column in flt:
+                    continue
+                if field.name in defaults or field.attname in defaults \
+                        or getattr(field, 'auto_now', False):
+                    value = field.pre_save(obj, False)
+                    set_doc[field.column] = field.get_db_prep_save(value, conn)
+
+        if (opts.pk.column not in flt and obj.pk is None
+                and isinstance(opts.pk, (AutoField, BigAutoField))):
+            auto = auto_increment(db_con, opts.db_table)
+            if auto:
+                obj.pk = auto['seq']
+
+        insert_doc = {}
+        for field in opts.concrete_fields:
+            if field.column in flt or field.column in set_doc:
+                continue
+            value = field.pre_save(obj, True)
+            if field.primary_key and value is None:
+                # No auto field entry: the document is keyed by its _id only
+                continue
+            insert_doc[field.column] = field.get_db_prep_save(value, conn)
+
+        upd = {}
+        if set_doc:
+            upd['$set'] = set_doc
+        upd['$setOnInsert'] = insert_doc or flt
+
+        collection = db_con[opts.db_table]
+        write_concern = self._mongo_options.get('write_concern')
+        if write_concern is None:
+            write_concern = getattr(opts, 'write_concern', None)
+        if write_concern is None:
+            write_concern = conn.settings_dict.get('OPTIONS', {}).get('WRITE_CONCERN')
+        if write_concern is not None:
+            collection = collection.with_options(write_concern=WriteConcern(**write_concern))
+
+        doc = collection.find_one_and_update(
+            flt, upd, upsert=True,
+            projection={'_id': False},
+            return_document=ReturnDocument.BEFORE
+        )
+        if doc is None or set_doc:
+            collection_written(db_con, opts.db_table, conn.settings_dict)
+        if doc is None:
+            obj._state.adding = False
+            obj._state.db = using
+            return obj, True
+
+        doc.update(set_doc)
+        values = []
+        for field in opts.concrete_fields:
+            value = doc.get(field.column)
+            if value is not None:
+                value = field.to_python(value)
+            values.append(value)
+        return self.model.from_db(using, [f.attname for f in opts.concrete_fields], values), False
+
+    # Asynchronous counterparts running on the asynchronous driver, see
+    # djongo.asynchronous. They cover model instances without
+    # select_related or prefetch_related.
+
+    async def _afetch_all(self):
+        if self._result_cache is not None:
+            return
+
+        if (self._iterable_class is not ModelIterable
+                or self.query.select_related
+                or self._prefetch_related_lookups):
+            raise NotSupportedError('Only plain model querysets can be fetched asynchronously')
+
+        compiler = self.query.get_compiler(using=self.db)
+        try:
+            sql, params = compiler.as_sql()
+        except EmptyResultSet:
+            self._result_cache = []
+            return
+
+        rows = await asynchronous.execute(connections[self.db], sql, params, self._mongo_options)
+        self._result_cache = list(self._instances(compiler, rows))
+
+    def _instances(self, compiler, rows):
+        klass_info = compiler.klass_info
+        model_cls = klass_info['model']
+        select_fields = klass_info['select_fields']
+        start, end = select_fields[0], select_fields[-1] + 1
+        init_list = [f[0].target.attname for f in compiler.select[start:end]]
+
+        for row in compiler.results_iter([rows]):
+            obj = model_cls.from_db(self.db, init_list, row[start:end])
+            for attr_name, col_pos in compiler.annotation_col_map.items():
+                setattr(obj, attr_name, row[col_pos])
+            yield obj
+
+    async def __aiter__(self):
+        await self._afetch_all()
+        for obj in self._result_cache:
+            yield obj
+
+    async def aget(self, *args, **kwargs):
+        clone = self.filter(*args, **kwargs)
+        if self.query.can_filter() and not self.query.distinct_fields:
+            clone = clone.order_by()
+        clone.query.set_limits(high=21)
+        await clone._afetch_all()
+
+        num = len(clone._result_cache)
+        if num == 1:
+            return clone._result_cache[0]
+        if not num:
+            raise self.model.DoesNotExist(
+                '%s matching query does not exist.' % self.model._meta.object_name)
+        raise self.model.MultipleObjectsReturned(
+            'get() returned more than one %s -- it returned %s!' %
+            (self.model._meta.object_name, num if num < 21 else 'more than 20'))
+
+    async def acount(self):
+        if self._result_cache is not None:
+            return len(self._result_cache)
+
+        try:
+            sql, params = self.query.get_compiler(using=self.db).as_sql()
+        except EmptyResultSet:
+            return 0
+        return await asynchronous.count(connections[self.db], sql, params, self._mongo_options)
+
+    async def aexists(self):
+        if self._result_cache is not None:
+            return bool(self._result_cache)
+        return await self[:1].acount() > 0
+
+    async def aupdate(self, **kwargs):
+        assert self.query.can_filter(), \
+            "Cannot update a query once a slice has been taken."
+        self._for_write = True
+        query = self.query.chain(UpdateQuery)
+        query.add_update_values(kwargs)
+        query._annotations = None
+        sql, params = query.get_compiler(self.db).as_sql()
+        rows = await asynchronous.execute(connections[self.db], sql, params, self._mongo_options)
+        self._result_cache = None
+        return rows
+    aupdate.alters_data = True
+
+
+def _prefetch_group(instances, lookups):
+    try:
+        prefetch_related_objects(instances, *lookups)
+    finally:
+        # Connections are per thread; the clients they use are shared
+        connections.close_all()
+
+
+class DjongoManager(Manager.from_queryset(DjongoQuerySet)):
     def __getattr__(self, name):
         try:
             return super().__getattr__(name)
@@ -30,16 +535,178 @@ class DjongoManager(Manager):
             return getattr(m_cli, name)
 
 
+class DirtyFieldsMixin:
+    """
+    Model mixin that remembers the values loaded from the database so
+    that save() on an existing instance only updates the changed
+    columns, as if update_fields had been given.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot_fields()
+        return instance
+
+    def _snapshot_value(self, field, value):
+        if isinstance(field, (ArrayModelField, EmbeddedModelField)) and value is not None:
+            return field.get_db_prep_value(value, connections[self._state.db], False)
+        if isinstance(value, (list, dict, set, Model)):
+            return copy.deepcopy(value)
+        return value
+
+    def _snapshot_fields(self, fields=None):
+        if fields is None or getattr(self, '_loaded_values', None) is None:
+            self._loaded_values = {}
+        for field in self._meta.concrete_fields:
+            if fields is not None and field.attname not in fields and field.name not in fields:
+                continue
+            if field.attname not in self.__dict__:
+                continue
+            self._loaded_values[field.attname] = self._snapshot_value(
+                field, self.__dict__[field.attname])
+
+    def get_dirty_fields(self):
+        """
+        Returns the names of the concrete fields that differ from the
+        values loaded from the database.
+        """
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return [f.name for f in self._meta.concrete_fields]
+
+        dirty = []
+        for field in self._meta.concrete_fields:
+            if field.attname not in self.__dict__:
+                continue
+            if field.attname not in loaded:
+                dirty.append(field.name)
+                continue
+            value = self._snapshot_value(field, self.__dict__[field.attname])
+            if value != loaded[field.attname]:
+                dirty.append(field.name)
+        return dirty
+
+    def save(self, force_insert=False, force_update=False, using=None,
+             update_fields=None):
+        if (update_fields is None
+                and not force_insert
+                and not self._state.adding
+                and getattr(self, '_loaded_values', None) is not None
+                and (using is None or using == self._state.db)):
+            dirty = self.get_dirty_fields()
+            # Nothing changed: a plain save, an empty update_fields would
+            # skip it altogether.
+            if dirty and self._meta.pk.name not in dirty:
+                update_fields = dirty + [
+                    f.name for f in self._meta.concrete_fields
+                    if getattr(f, 'auto_now', False) and f.name not in dirty
+                ]
+
+        super().save(force_insert=force_insert, force_update=force_update,
+                     using=using, update_fields=update_fields)
+        self._snapshot_fields()
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        self._snapshot_fields(fields)
+
+
+def _rewrites(method):
+    def wrapper(self, *args, **kwargs):
+        self._rewrite = True
+        return method(self, *args, **kwargs)
+    return wrapper
+
+
+class ArrayModelList(list):
+    """
+    List of embedded models loaded by an ArrayModelField with
+    track_changes=True. append(), extend(), remove_matching() and
+    update_at() are recorded so that saving sends $push, $pull or a
+    positional $set instead of the whole array, and an unchanged array is
+    not written at all. Any other mutation, or mixing kinds of changes,
+    falls back to rewriting the array, as does a list built by the
+    caller. Edits made to an element in place are not seen; use
+    update_at() for those.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reset_ops()
+        self._rewrite = True
+
+    def reset_ops(self):
+        self._push = []
+        self._pull = []
+        self._set_at = {}
+        self._rewrite = False
+
+    def append(self, mdl):
+        super().append(mdl)
+        self._push.append(mdl)
+
+    def extend(self, mdls):
+        mdls = list(mdls)
+        super().extend(mdls)
+        self._push.extend(mdls)
+
+    def __iadd__(self, mdls):
+        self.extend(mdls)
+        return self
+
+    def __reduce_ex__(self, protocol):
+        # Rebuilt from the items with the pending operations as state:
+        # the default reduction would replay the items through extend()
+        state = {
+            '_push': list(self._push),
+            '_pull': list(self._pull),
+            '_set_at': dict(self._set_at),
+            '_rewrite': self._rewrite,
+        }
+        return self.__class__, (list(self),), state
+
+    def remove_matching(self, **kwargs):
+        """
+        Removes the models whose attributes equal all of `kwargs`.
+        """
+        keep = [mdl for mdl in self
+                if not all(getattr(mdl, k) == v for k, v in kwargs.items())]
+        list.__setitem__(self, slice(None), keep)
+        self._pull.append(kwargs)
+
+    def update_at(self, index, mdl):
+        """
+        Replaces the model at `index`.
+        """
+        if index < 0:
+            index += len(self)
+        list.__setitem__(self, index, mdl)
+        self._set_at[index] = mdl
+
+    __setitem__ = _rewrites(list.__setitem__)
+    __delitem__ = _rewrites(list.__delitem__)
+    __imul__ = _rewrites(list.__imul__)
+    insert = _rewrites(list.insert)
+    pop = _rewrites(list.pop)
+    remove = _rewrites(list.remove)
+    clear = _rewrites(list.clear)
+    sort = _rewrites(list.sort)
+    reverse = _rewrites(list.reverse)
+
+
 class ArrayModelField(Field):
 
     def __init__(self,
                  model_container: typing.Type[Model],
                  model_form: typing.Type[forms.ModelForm]=None,
                  model_form_kwargs_l: dict=None,
+                 track_changes: bool=False,
                  *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.model_container = model_container
         self.model_form = model_form
+        self.track_changes = track_changes
 
         if model_form_kwargs_l is None:
             model_form_kwargs_l = {}
@@ -55,6 +722,9 @@ class ArrayModelField(Field):
         if self.model_form_kwargs_l:
             kwargs['model_form_kwargs_l'] = self.model_form_kwargs_l
 
+        if self.track_changes:
+            kwargs['track_changes'] = True
+
         return name, path, args, kwargs
 
     def get_db_prep_value(self, value, connection, prepared):
@@ -64,22 +734,63 @@ class ArrayModelField(Field):
         if not isinstance(value, list):
             raise TypeError('Object must be of type list')
 
-        ret = []
-        for a_mdl in value:
-            mdl_ob = {}
-            if not isinstance(a_mdl, Model):
-                raise TypeError('Array items must be of type Model')
-            for fld in a_mdl._meta.get_fields():
-                if not useful_field(fld):
-                    continue
-                fld_value = getattr(a_mdl, fld.attname)
-                mdl_ob[fld.attname] = fld.get_db_prep_value(fld_value, connection, prepared)
-            ret.append(mdl_ob)
+        return [self._mdl_to_dict(a_mdl, connection, prepared) for a_mdl in value]
 
-        return ret
+    @staticmethod
+    def _mdl_to_dict(a_mdl, connection, prepared):
+        if not isinstance(a_mdl, Model):
+            raise TypeError('Array items must be of type Model')
+
+        mdl_ob = {}
+        for fld in a_mdl._meta.get_fields():
+            if not useful_field(fld):
+                continue
+            fld_value = getattr(a_mdl, fld.attname)
+            mdl_ob[fld.attname] = fld.get_db_prep_value(fld_value, connection, prepared)
+        return mdl_ob
+
+    def get_db_prep_save(self, value, connection):
+        prep = super().get_db_prep_save(value, connection)
+        if not isinstance(value, ArrayModelList) or value._rewrite:
+            return prep
+
+        pull = []
+        for kwargs in value._pull:
+            cond = {}
+            for name, fld_value in kwargs.items():
+                fld = self.model_container._meta.get_field(name)
+                cond[fld.attname] = fld.get_db_prep_value(fld_value, connection, False)
+            pull.append(cond)
+
+        return ArrayUpdate(
+            prep,
+            push=[self._mdl_to_dict(a_mdl, connection, False) for a_mdl in value._push],
+            pull=pull,
+            set_at={i: self._mdl_to_dict(a_mdl, connection, False)
+                    for i, a_mdl in value._set_at.items()}
+        )
+
+    def contribute_to_class(self, cls, name, *args, **kwargs):
+        super().contribute_to_class(cls, name, *args, **kwargs)
+        if self.track_changes and not cls._meta.abstract:
+            post_save.connect(self._saved, sender=cls, weak=False)
+
+    def _saved(self, sender, instance, update_fields=None, **kwargs):
+        if update_fields is not None and self.name not in update_fields:
+            return
+
+        value = instance.__dict__.get(self.attname)
+        if isinstance(value, list):
+            if not isinstance(value, ArrayModelList):
+                value = instance.__dict__[self.attname] = ArrayModelList(value)
+            value.reset_ops()
 
     def from_db_value(self, value, expression, connection, context):
-        return self.to_python(value)
+        value = self.to_python(value)
+        if self.track_changes and value is not None:
+            value = ArrayModelList(value)
+            value.reset_ops()
+        return value
 
     def to_python(self, value):
         if value is None:
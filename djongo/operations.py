@@ -1,6 +1,14 @@
 from django.db.backends.base.operations import BaseDatabaseOperations
 from django.utils import six
+from concurrent.futures import ThreadPoolExecutor
 import datetime, calendar
+import re
+
+from .creation import index_models
+from .cursor import IN_BATCH_SIZE, collection_written, table_meta
+
+# Collections emptied concurrently by a flush
+FLUSH_WORKERS = 8
 
 
 class DatabaseOperations(BaseDatabaseOperations):
@@ -50,6 +58,55 @@ class DatabaseOperations(BaseDatabaseOperations):
             converters.append(self.convert_timefield_value)
         return converters
 
+    def bulk_batch_size(self, fields, objs):
+        return IN_BATCH_SIZE
+
     def sql_flush(self, style, tables, sequences, allow_cascade=False):
-        # TODO: Need to implement this fully
-        return ['ALTER TABLE']
+        return ['DELETE FROM {}'.format(self.quote_name(table)) for table in tables]
+
+    def execute_sql_flush(self, using, sql_list):
+        """
+        Empties the flushed collections in parallel with delete_many, which
+        keeps their indexes, and resets their `__schema__` counters. Capped
+        collections, which do not allow deletes, are dropped and recreated
+        with the same options and indexes.
+        """
+        tables = []
+        for sql in sql_list:
+            match = re.match(r'DELETE FROM "([^"]+)"$', sql)
+            if match:
+                tables.append(match.group(1))
+            else:
+                with self.connection.cursor() as cursor:
+                    cursor.execute(sql)
+
+        if not tables:
+            return
+
+        self.connection.ensure_connection()
+        db_con = self.connection.connection
+        with self.connection.wrap_database_errors:
+            with ThreadPoolExecutor(max_workers=min(FLUSH_WORKERS, len(tables))) as executor:
+                list(executor.map(lambda table: self._empty_collection(db_con, table), tables))
+
+            db_con['__schema__'].update_many(
+                {'name': {'$in': tables}},
+                {'$set': {'auto.seq': 0}}
+            )
+
+        for table in tables:
+            collection_written(db_con, table, self.connection.settings_dict)
+
+    @staticmethod
+    def _empty_collection(db_con, table):
+        if getattr(table_meta(table), 'capped', None) is None:
+            db_con[table].delete_many({})
+            return
+
+        collection = db_con[table]
+        options = collection.options()
+        indexes = index_models(collection)
+        db_con.drop_collection(table)
+        db_con.create_collection(table, **options)
+        if indexes:
+            db_con[table].create_indexes(indexes)
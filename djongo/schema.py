@@ -1,11 +1,48 @@
 from django.db.backends.base.schema import BaseDatabaseSchemaEditor
+from pymongo import IndexModel, ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+import logging
+
+from .cursor import ArrayUpdate, ChunkedWriter, collection_written
+from .models import MongoIndex
+
+logger = logging.getLogger(__name__)
+
+# BSON types matched by the partial filter of unique indexes on
+# nullable fields, so that several NULLs are allowed like in SQL.
+NOT_NULL_TYPES = {
+    'char': 'string',
+    'integer': 'number',
+    'bigint': 'number',
+    'float': 'number',
+    'date': 'date',
+    'datetime': 'date',
+    'time': 'date',
+    'bool': 'bool',
+}
+
+# $convert targets for the column types, used when alter_field changes
+# the type of a column.
+CONVERT_TYPES = {
+    'char': 'string',
+    'integer': 'int',
+    'bigint': 'long',
+    'float': 'double',
+    'date': 'date',
+    'datetime': 'date',
+    'bool': 'bool',
+}
 
 
 class DatabaseSchemaEditor(BaseDatabaseSchemaEditor):
 
+    # Build indexes without blocking writes on servers older than 4.2;
+    # newer servers ignore the option and always build this way.
+    background_indexes = True
+
     def create_model(self, model):
         db_con = self.connection.connection
-        db_con.create_collection(model._meta.db_table)
+        db_con.create_collection(model._meta.db_table, **self._collection_options(model))
 
         # print('created coll {}'.format(model._meta.db_table))
 
@@ -21,3 +58,259 @@ class DatabaseSchemaEditor(BaseDatabaseSchemaEditor):
                         }
                     }
                 )
+
+        self._create_indexes(model, self._model_indexes(model))
+
+        for field in model._meta.local_many_to_many:
+            if field.remote_field.through._meta.auto_created:
+                self.create_model(field.remote_field.through)
+
+    def delete_model(self, model):
+        for field in model._meta.local_many_to_many:
+            if field.remote_field.through._meta.auto_created:
+                self.delete_model(field.remote_field.through)
+
+        db_con = self.connection.connection
+        db_con.drop_collection(model._meta.db_table)
+        db_con['__schema__'].delete_many({'name': model._meta.db_table})
+        self._bump(model._meta.db_table)
+
+    def alter_db_table(self, model, old_db_table, new_db_table):
+        if old_db_table == new_db_table:
+            return
+
+        db_con = self.connection.connection
+        db_con[old_db_table].rename(new_db_table)
+        db_con['__schema__'].update_many(
+            {'name': old_db_table},
+            {'$set': {'name': new_db_table}}
+        )
+        self._bump(old_db_table, new_db_table)
+
+    def _collection_options(self, model):
+        """
+        Options of create_collection for the `timeseries` or `capped` Meta
+        option of `model`.
+
+        timeseries is a dict with `time_field`, and optionally `meta_field`,
+        `granularity` and `expire_after_seconds`; capped is a dict with the
+        `size` in bytes and optionally the `max` number of documents.
+        """
+        opts = model._meta
+        timeseries = getattr(opts, 'timeseries', None)
+        capped = getattr(opts, 'capped', None)
+        if timeseries is not None and capped is not None:
+            raise ValueError('{}: a collection cannot be both time-series and capped'
+                             .format(opts.label))
+
+        kwargs = {}
+        if timeseries is not None:
+            kwargs['timeseries'] = {'timeField': opts.get_field(timeseries['time_field']).column}
+            if timeseries.get('meta_field'):
+                kwargs['timeseries']['metaField'] = opts.get_field(timeseries['meta_field']).column
+            if timeseries.get('granularity'):
+                kwargs['timeseries']['granularity'] = timeseries['granularity']
+            if timeseries.get('expire_after_seconds') is not None:
+                kwargs['expireAfterSeconds'] = timeseries['expire_after_seconds']
+
+        elif capped is not None:
+            kwargs['capped'] = True
+            kwargs['size'] = capped['size']
+            if capped.get('max'):
+                kwargs['max'] = capped['max']
+
+        return kwargs
+
+    def add_index(self, model, index):
+        self._create_indexes(model, [self._meta_index(model, index)])
+
+    def remove_index(self, model, index):
+        self._drop_indexes(model, [index.name])
+
+    def alter_unique_together(self, model, old_unique_together, new_unique_together):
+        olds = {tuple(fields) for fields in old_unique_together}
+        news = {tuple(fields) for fields in new_unique_together}
+        self._drop_indexes(model, [self._together_index(model, fields, unique=True).document['name']
+                                   for fields in olds.difference(news)])
+        self._create_indexes(model, [self._together_index(model, fields, unique=True)
+                                     for fields in news.difference(olds)])
+
+    def alter_index_together(self, model, old_index_together, new_index_together):
+        olds = {tuple(fields) for fields in old_index_together}
+        news = {tuple(fields) for fields in new_index_together}
+        self._drop_indexes(model, [self._together_index(model, fields).document['name']
+                                   for fields in olds.difference(news)])
+        self._create_indexes(model, [self._together_index(model, fields)
+                                     for fields in news.difference(olds)])
+
+    def add_field(self, model, field):
+        if field.many_to_many:
+            if field.remote_field.through._meta.auto_created:
+                self.create_model(field.remote_field.through)
+            return
+
+        default = self.effective_default(field)
+        if isinstance(default, ArrayUpdate):
+            default = default.value
+        self._writer(model).update(
+            {field.column: {'$exists': False}},
+            {'$set': {field.column: default}}
+        )
+        self._bump(model._meta.db_table)
+        self._create_indexes(model, self._field_indexes(model, field))
+
+    def remove_field(self, model, field):
+        if field.many_to_many:
+            if field.remote_field.through._meta.auto_created:
+                self.delete_model(field.remote_field.through)
+            return
+
+        self._drop_indexes(model, [index.document['name']
+                                   for index in self._field_indexes(model, field)])
+        self._writer(model).update(
+            {field.column: {'$exists': True}},
+            {'$unset': {field.column: ''}}
+        )
+        self._bump(model._meta.db_table)
+
+    def alter_field(self, model, old_field, new_field, strict=False):
+        if old_field.many_to_many and new_field.many_to_many:
+            old_through = old_field.remote_field.through._meta
+            new_through = new_field.remote_field.through._meta
+            if old_through.auto_created and new_through.auto_created:
+                self.alter_db_table(old_field.remote_field.through,
+                                    old_through.db_table, new_through.db_table)
+            return
+
+        # Drop the indexes going away before rewriting the documents, so
+        # they are not maintained during the rewrite.
+        old_indexes = {index.document['name']: index
+                       for index in self._field_indexes(model, old_field)}
+        new_indexes = {index.document['name']: index
+                       for index in self._field_indexes(model, new_field)}
+        self._drop_indexes(model, [name for name, index in old_indexes.items()
+                                   if name not in new_indexes
+                                   or new_indexes[name].document != index.document])
+
+        if old_field.column != new_field.column:
+            self._writer(model).update(
+                {old_field.column: {'$exists': True}},
+                {'$rename': {old_field.column: new_field.column}}
+            )
+
+        old_type = old_field.db_type(self.connection)
+        new_type = new_field.db_type(self.connection)
+        if old_type != new_type and new_type in CONVERT_TYPES:
+            column = '$' + new_field.column
+            self._writer(model).update(
+                {new_field.column: {'$exists': True}},
+                [{'$set': {new_field.column: {'$convert': {
+                    'input': column,
+                    'to': CONVERT_TYPES[new_type],
+                    'onError': column,
+                    'onNull': None
+                }}}}]
+            )
+
+        if old_field.null and not new_field.null:
+            default = self.effective_default(new_field)
+            if default is not None:
+                self._writer(model).update(
+                    {new_field.column: None},
+                    {'$set': {new_field.column: default}}
+                )
+
+        self._bump(model._meta.db_table)
+        self._create_indexes(model, [index for name, index in new_indexes.items()
+                                     if name not in old_indexes
+                                     or old_indexes[name].document != index.document])
+
+    def _writer(self, model):
+        """
+        Data changes of migrations run in throttled batches, configured
+        with the MIGRATION_CHUNKS dict of DATABASES OPTIONS (ChunkedWriter
+        arguments).
+        """
+        options = self.connection.settings_dict.get('OPTIONS', {})
+        return ChunkedWriter(self.connection.connection[model._meta.db_table],
+                             **options.get('MIGRATION_CHUNKS', {}))
+
+    def _bump(self, *tables):
+        for table in tables:
+            collection_written(self.connection.connection, table, self.connection.settings_dict)
+
+    def _create_indexes(self, model, indexes):
+        if not indexes:
+            return
+        names = self.connection.connection[model._meta.db_table].create_indexes(indexes)
+        logger.debug('created indexes {} on {}'.format(names, model._meta.db_table))
+
+    def _drop_indexes(self, model, names):
+        coll = self.connection.connection[model._meta.db_table]
+        for name in names:
+            try:
+                coll.drop_index(name)
+            except OperationFailure as e:
+                logger.debug('drop index {} on {}: {}'.format(name, model._meta.db_table, e))
+
+    def _index_model(self, keys, name, **kwargs):
+        if self.background_indexes:
+            kwargs['background'] = True
+        return IndexModel(keys, name=name, **kwargs)
+
+    def _model_indexes(self, model):
+        indexes = []
+        for field in model._meta.local_fields:
+            indexes.extend(self._field_indexes(model, field))
+        if getattr(model._meta, 'timeseries', None) is None:
+            for fields in model._meta.unique_together:
+                indexes.append(self._together_index(model, fields, unique=True))
+        for fields in model._meta.index_together:
+            indexes.append(self._together_index(model, fields))
+        for index in model._meta.indexes:
+            indexes.append(self._meta_index(model, index))
+        return indexes
+
+    def _field_indexes(self, model, field):
+        if not field.concrete or field.many_to_many:
+            return []
+
+        keys = [(field.column, ASCENDING)]
+        if getattr(model._meta, 'timeseries', None) is not None:
+            # Time-series collections do not support unique indexes
+            if field.db_index and not field.unique:
+                return [self._index_model(keys, '{}_idx'.format(field.column))]
+            return []
+
+        if field.primary_key:
+            if field.column == '_id':
+                # MongoDB always keeps a unique index on _id
+                return []
+            return [self._index_model(keys, '{}_pk'.format(field.column), unique=True)]
+
+        if field.unique:
+            kwargs = {}
+            not_null_type = NOT_NULL_TYPES.get(field.db_type(self.connection))
+            if field.null and not_null_type:
+                kwargs['partialFilterExpression'] = {field.column: {'$type': not_null_type}}
+            return [self._index_model(keys, '{}_uniq'.format(field.column), unique=True, **kwargs)]
+
+        if field.db_index:
+            return [self._index_model(keys, '{}_idx'.format(field.column))]
+
+        return []
+
+    def _together_index(self, model, fields, unique=False):
+        columns = [model._meta.get_field(field).column for field in fields]
+        keys = [(column, ASCENDING) for column in columns]
+        if unique:
+            return self._index_model(keys, '{}_uniq'.format('_'.join(columns)), unique=True)
+        return self._index_model(keys, '{}_idx'.format('_'.join(columns)))
+
+    def _meta_index(self, model, index):
+        if isinstance(index, MongoIndex):
+            return self._index_model(index.mongo_keys(model), index.name, **index.mongo_options())
+
+        keys = [(model._meta.get_field(field).column, DESCENDING if order == 'DESC' else ASCENDING)
+                for field, order in index.fields_orders]
+        return self._index_model(keys, index.name)
@@ -3,7 +3,7 @@ from distutils.core import setup
 setup(
     name='djongo',
     version='1.2.3',
-    packages=['djongo'],
+    packages=['djongo', 'djongo.management', 'djongo.management.commands'],
     url='https://nesdis.github.io/djongo/',
     license='BSD',
     author='nesdis',
@@ -0,0 +1,11 @@
+import django
+from django.conf import settings
+
+# The unit tests use mocked MongoDB clients: no server is connected to.
+if not settings.configured:
+    settings.configure(
+        INSTALLED_APPS=['django.contrib.contenttypes', 'django.contrib.auth', 'tests'],
+        DATABASES={'default': {'ENGINE': 'djongo', 'NAME': 'djongo_unit'}},
+        USE_TZ=False,
+    )
+    django.setup()
@@ -0,0 +1,97 @@
+from djongo import models
+
+
+class Blog(models.Model):
+    name = models.CharField(max_length=50)
+    views = models.IntegerField(default=0)
+    modified = models.DateTimeField(auto_now=True)
+    objects = models.DjongoManager()
+
+
+class Tag(models.Model):
+    slug = models.CharField(max_length=50, primary_key=True)
+    count = models.IntegerField(default=0)
+    objects = models.DjongoManager()
+
+
+class Entry(models.DirtyFieldsMixin, models.Model):
+    headline = models.CharField(max_length=50)
+    body = models.TextField()
+    modified = models.DateTimeField(auto_now=True)
+    objects = models.DjongoManager()
+
+
+class Comment(models.Model):
+    text = models.CharField(max_length=50)
+
+    class Meta:
+        abstract = True
+
+
+class Post(models.Model):
+    comments = models.ArrayModelField(model_container=Comment, track_changes=True)
+    history = models.ArrayModelField(model_container=Comment)
+    objects = models.DjongoManager()
+
+
+class Article(models.Model):
+    slug = models.CharField(max_length=50, unique=True, null=True)
+    author = models.CharField(max_length=50, db_index=True)
+    views = models.IntegerField(default=0)
+    published = models.DateTimeField(null=True)
+
+    class Meta:
+        unique_together = [('author', 'published')]
+        indexes = [
+            models.Index(fields=['-published'], name='published_desc'),
+            models.MongoIndex(fields=['author'], name='author_hashed', index_type='hashed'),
+        ]
+
+
+class AuthorViews(models.Model):
+    author = models.CharField(max_length=50)
+    views = models.IntegerField()
+
+    class Meta:
+        managed = False
+        materialized_view = {
+            'source': 'tests.Article',
+            'pipeline': [{'$group': {'_id': '$author', 'views': {'$sum': '$views'}}},
+                         {'$project': {'_id': False, 'author': '$_id', 'views': True}}],
+            'on': 'author',
+            'watermark': 'id',
+            'when_matched': [{'$set': {'views': {'$add': ['$views', '$$new.views']}}}],
+        }
+
+
+class BlogEntry(models.Model):
+    blog = models.ForeignKey(Blog, on_delete=models.CASCADE, related_name='entries')
+    tags = models.ManyToManyField(Tag)
+    objects = models.DjongoManager()
+
+
+class Subscriber(models.Model):
+    blog = models.ForeignKey(Blog, on_delete=models.CASCADE, related_name='subscribers')
+    objects = models.DjongoManager()
+
+
+class Reading(models.Model):
+    sensor = models.CharField(max_length=50, unique=True)
+    value = models.FloatField(db_index=True)
+    taken = models.DateTimeField()
+
+    class Meta:
+        unique_together = [('sensor', 'taken')]
+        timeseries = {
+            'time_field': 'taken',
+            'meta_field': 'sensor',
+            'granularity': 'hours',
+            'expire_after_seconds': 86400,
+        }
+
+
+class LogEntry(models.Model):
+    message = models.CharField(max_length=200)
+
+    class Meta:
+        capped = {'size': 4096, 'max': 100}
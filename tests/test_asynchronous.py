@@ -0,0 +1,147 @@
+import asyncio
+import unittest
+from collections import defaultdict
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from django.db import connection
+from pymongo.results import DeleteResult, UpdateResult
+
+from djongo import asynchronous
+from djongo.cache import get_result_cache
+from djongo.cursor import UNACKNOWLEDGED_ROWCOUNT
+from .models import Blog
+from .utils import mock_db
+
+
+def mock_async_db():
+    """
+    A database of the asynchronous driver: find returns a cursor iterated
+    with async for, the other methods are coroutines.
+    """
+    db = MagicMock()
+    db.name = 'djongo_unit'
+    collections = defaultdict(mock_async_collection)
+    db.__getitem__.side_effect = lambda name: collections[name]
+    return db
+
+
+def mock_async_collection():
+    collection = MagicMock()
+    collection.find.return_value.__aiter__.return_value = []
+    for method in ('count_documents', 'update_many', 'delete_many', 'aggregate'):
+        setattr(collection, method, AsyncMock())
+    return collection
+
+
+class AsyncTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.db = mock_async_db()
+        patcher = patch('djongo.asynchronous.get_database', return_value=self.db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # The synchronous database, which the version of written pinned
+        # tables is bumped on
+        self.sync_db = mock_db()
+        self.sync_db.name = 'djongo_unit'
+        connection.connection = self.sync_db
+
+    def tearDown(self):
+        connection.connection = None
+
+    def found(self, *docs):
+        self.db['tests_blog'].find.return_value.__aiter__.return_value = list(docs)
+
+    def find_kwargs(self):
+        return self.db['tests_blog'].find.call_args[1]
+
+
+class TestExecute(AsyncTestCase):
+    '''Test cases for statements run on the asynchronous driver'''
+
+    def test_select(self):
+        self.found({'id': 1, 'name': 'djongo', 'views': 3, 'modified': None})
+        rows = asyncio.run(asynchronous.execute(
+            connection, 'SELECT "tests_blog"."id", "tests_blog"."name" FROM "tests_blog" '
+            'WHERE "tests_blog"."views" = %s', [3]))
+        self.assertEqual(rows, [(1, 'djongo')])
+        self.assertEqual(self.find_kwargs()['filter'], {'$and': [{'views': {'$eq': 3}}]})
+
+    def test_rowcount(self):
+        collection = self.db['tests_blog']
+        collection.update_many.return_value = UpdateResult({'n': 2, 'nModified': 2}, True)
+        collection.delete_many.return_value = DeleteResult({'n': 3}, True)
+
+        rows = asyncio.run(asynchronous.execute(
+            connection, 'UPDATE "tests_blog" SET "views" = %s', [0]))
+        self.assertEqual(rows, 2)
+        rows = asyncio.run(asynchronous.execute(
+            connection, 'DELETE FROM "tests_blog" WHERE "tests_blog"."id" = %s', [1]))
+        self.assertEqual(rows, 3)
+
+        collection.delete_many.return_value = DeleteResult(None, acknowledged=False)
+        rows = asyncio.run(asynchronous.execute(
+            connection, 'DELETE FROM "tests_blog" WHERE "tests_blog"."id" = %s', [1]))
+        self.assertEqual(rows, UNACKNOWLEDGED_ROWCOUNT)
+
+    def test_cache_bump(self):
+        self.db['tests_blog'].update_many.return_value = UpdateResult({'n': 1}, True)
+        config = {'BACKEND': 'djongo.cache.LocMemResultCache', 'TIMEOUT': 7}
+        with patch.dict(connection.settings_dict['OPTIONS'], RESULT_CACHE=config):
+            cache = get_result_cache(connection.settings_dict)
+            before = cache.versions('djongo_unit', ['tests_blog'])
+            asyncio.run(asynchronous.execute(
+                connection, 'UPDATE "tests_blog" SET "views" = %s', [0]))
+            self.assertEqual(cache.versions('djongo_unit', ['tests_blog']), [before[0] + 1])
+
+    def test_pinned_written(self):
+        self.db['tests_blog'].update_many.return_value = UpdateResult({'n': 1}, True)
+        with patch.dict(connection.settings_dict['OPTIONS'], PINNED_TABLES=['tests_blog']), \
+                patch('djongo.cursor.pinned_tables.discard') as discard:
+            asyncio.run(asynchronous.execute(
+                connection, 'UPDATE "tests_blog" SET "views" = %s', [0]))
+        discard.assert_called_once_with('djongo_unit', 'tests_blog')
+        self.sync_db['__pinned__'].update_one.assert_called_once_with(
+            {'_id': 'tests_blog'}, {'$inc': {'version': 1}}, upsert=True)
+
+    def test_count(self):
+        self.db['tests_blog'].count_documents.return_value = 5
+        count = asyncio.run(asynchronous.count(
+            connection, 'SELECT "tests_blog"."id", "tests_blog"."name" FROM "tests_blog" '
+            'WHERE "tests_blog"."views" = %s', [3]))
+        self.assertEqual(count, 5)
+        self.db['tests_blog'].count_documents.assert_called_once_with(
+            {'$and': [{'views': {'$eq': 3}}]})
+
+
+class TestQuerySet(AsyncTestCase):
+    '''Test cases for the asynchronous methods of DjongoQuerySet'''
+
+    def test_aget(self):
+        self.found({'id': 1, 'name': 'djongo', 'views': 3, 'modified': None})
+        blog = asyncio.run(Blog.objects.aget(name='djongo'))
+        self.assertEqual((blog.pk, blog.name, blog.views), (1, 'djongo', 3))
+        self.assertEqual(self.find_kwargs()['filter'], {'$and': [{'name': {'$eq': 'djongo'}}]})
+        self.assertEqual(self.find_kwargs()['limit'], 21)
+
+    def test_aget_missing(self):
+        with self.assertRaises(Blog.DoesNotExist):
+            asyncio.run(Blog.objects.aget(name='djongo'))
+
+        self.found({'id': 1, 'name': 'djongo', 'views': 3, 'modified': None},
+                   {'id': 2, 'name': 'djongo', 'views': 4, 'modified': None})
+        with self.assertRaises(Blog.MultipleObjectsReturned):
+            asyncio.run(Blog.objects.aget(name='djongo'))
+
+    def test_acount(self):
+        self.db['tests_blog'].count_documents.return_value = 2
+        self.assertEqual(asyncio.run(Blog.objects.filter(views=3).acount()), 2)
+        self.db['tests_blog'].count_documents.assert_called_once_with(
+            {'$and': [{'views': {'$eq': 3}}]})
+
+        self.assertEqual(asyncio.run(Blog.objects.none().acount()), 0)
+        self.db['tests_blog'].count_documents.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from django.db import connection
+
+from djongo.creation import copy_database, COPY_BATCH_SIZE
+from .utils import mock_client
+
+
+class TestCopyDatabase(unittest.TestCase):
+    '''Test cases for copying databases on the server'''
+
+    def setUp(self):
+        self.client = mock_client()
+        self.source = self.client['source']
+        self.target = self.client['target']
+
+    def test_plain_collection(self):
+        self.source.list_collections.return_value = [
+            {'name': 'tests_blog', 'type': 'collection', 'options': {}},
+            {'name': 'system.views', 'type': 'collection', 'options': {}},
+        ]
+        self.source['tests_blog'].list_indexes.return_value = [
+            {'v': 2, 'key': {'_id': 1}, 'name': '_id_'},
+            {'v': 2, 'key': {'name': 1}, 'name': 'name_1', 'unique': True},
+        ]
+        copy_database(self.client, 'source', 'target')
+
+        self.source['tests_blog'].aggregate.assert_called_once_with(
+            [{'$out': {'db': 'target', 'coll': 'tests_blog'}}])
+        self.source['system.views'].aggregate.assert_not_called()
+        self.target.create_collection.assert_not_called()
+
+        indexes, = self.target['tests_blog'].create_indexes.call_args[0]
+        self.assertEqual([index.document for index in indexes],
+                         [{'key': {'name': 1}, 'name': 'name_1', 'unique': True}])
+
+    def test_collection_with_options(self):
+        options = {'capped': True, 'size': 4096}
+        self.source.list_collections.return_value = [
+            {'name': 'tests_log', 'type': 'collection', 'options': options},
+        ]
+        self.source['tests_log'].find.return_value = [{'_id': i} for i in range(COPY_BATCH_SIZE + 1)]
+        self.source['tests_log'].list_indexes.return_value = [
+            {'v': 2, 'key': {'_id': 1}, 'name': '_id_'},
+        ]
+        copy_database(self.client, 'source', 'target')
+
+        self.target.create_collection.assert_called_once_with('tests_log', **options)
+        self.source['tests_log'].aggregate.assert_not_called()
+        batches = [call[0][0] for call in self.target['tests_log'].insert_many.call_args_list]
+        self.assertEqual([len(batch) for batch in batches], [COPY_BATCH_SIZE, 1])
+        self.target['tests_log'].create_indexes.assert_not_called()
+
+    def test_view(self):
+        options = {'viewOn': 'tests_blog', 'pipeline': []}
+        self.source.list_collections.return_value = [
+            {'name': 'tests_view', 'type': 'view', 'options': options},
+        ]
+        copy_database(self.client, 'source', 'target')
+
+        self.target.create_collection.assert_called_once_with('tests_view', **options)
+        self.source['tests_view'].aggregate.assert_not_called()
+        self.source['tests_view'].list_indexes.assert_not_called()
+
+
+class TestDatabaseCreation(unittest.TestCase):
+    '''Test cases for creating and cloning test databases'''
+
+    def setUp(self):
+        self.client = mock_client()
+        self.client.list_database_names.return_value = []
+        connection.connection = MagicMock(client=self.client)
+        self.creation = connection.creation
+
+    def tearDown(self):
+        connection.connection = None
+
+    def test_create(self):
+        name = self.creation._create_test_db(verbosity=0, autoclobber=False)
+        self.assertEqual(name, 'test_djongo_unit')
+        self.client.drop_database.assert_not_called()
+        self.client['djongo_unit'].list_collections.assert_not_called()
+
+    def test_keepdb(self):
+        self.client.list_database_names.return_value = ['test_djongo_unit']
+        self.creation._create_test_db(verbosity=0, autoclobber=True, keepdb=True)
+        self.client.drop_database.assert_not_called()
+
+    def test_autoclobber(self):
+        self.client.list_database_names.return_value = ['test_djongo_unit']
+        self.creation._create_test_db(verbosity=0, autoclobber=True)
+        self.client.drop_database.assert_called_once_with('test_djongo_unit')
+
+    def test_cancelled(self):
+        self.client.list_database_names.return_value = ['test_djongo_unit']
+        with patch('builtins.input', return_value='no'), \
+                patch.object(self.creation, 'log'), \
+                self.assertRaises(SystemExit):
+            self.creation._create_test_db(verbosity=0, autoclobber=False)
+        self.client.drop_database.assert_not_called()
+
+    def test_template(self):
+        with patch.dict(connection.settings_dict['TEST'], TEMPLATE='djongo_template'), \
+                patch('djongo.creation.copy_database') as copy:
+            self.creation._create_test_db(verbosity=0, autoclobber=False)
+        copy.assert_called_once_with(self.client, 'djongo_template', 'test_djongo_unit')
+
+    def test_clone(self):
+        self.client.list_database_names.return_value = ['djongo_unit_1']
+        with patch('djongo.creation.copy_database') as copy:
+            self.creation._clone_test_db('1', verbosity=0)
+        self.client.drop_database.assert_called_once_with('djongo_unit_1')
+        copy.assert_called_once_with(self.client, 'djongo_unit', 'djongo_unit_1')
+
+        self.client.drop_database.reset_mock()
+        copy.reset_mock()
+        self.creation._clone_test_db('1', verbosity=0, keepdb=True)
+        self.client.drop_database.assert_not_called()
+        copy.assert_not_called()
+
+    def test_destroy(self):
+        self.creation._destroy_test_db('test_djongo_unit', verbosity=0)
+        self.client.drop_database.assert_called_once_with('test_djongo_unit')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,591 @@
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from django.db import connection
+
+from pymongo.errors import PyMongoError, ExecutionTimeout
+from pymongo import InsertOne
+from pymongo.results import UpdateResult, DeleteResult
+
+from djongo.database import NotSupportedError, OperationalError
+from djongo.cursor import Parse, ArrayUpdate, WriteBuffer, ChunkedWriter, Cursor, SingleFlight, \
+    ResultCursor
+from djongo.deadline import deadline
+from .models import Blog
+from .utils import mock_db
+
+
+class TestUpdateTranslation(unittest.TestCase):
+    '''Test cases for translating UPDATE statements'''
+
+    def update_kwargs(self, sql, params):
+        db = MagicMock()
+        Parse(db, sql, params).get_mongo_cur()
+        return db['app_post'].update_many.call_args[1]
+
+    def test_set_params(self):
+        kw = self.update_kwargs(
+            'UPDATE "app_post" SET "title" = %s, "views" = %s WHERE "app_post"."id" = %s',
+            ['a', 2, 1])
+        self.assertEqual(kw['update'], {'$set': {'title': 'a', 'views': 2}})
+        self.assertEqual(kw['filter'], {'$and': [{'id': {'$eq': 1}}]})
+
+    def test_column_increment(self):
+        kw = self.update_kwargs(
+            'UPDATE "app_post" SET "views" = ("app_post"."views" + %s) WHERE "app_post"."id" = %s',
+            [1, 1])
+        self.assertEqual(kw['update'], {'$inc': {'views': 1}})
+
+    def test_column_decrement_and_set(self):
+        kw = self.update_kwargs(
+            'UPDATE "app_post" SET "views" = ("app_post"."views" - %s), "title" = %s',
+            [3, 'a'])
+        self.assertEqual(kw['update'], {'$inc': {'views': -3}, '$set': {'title': 'a'}})
+        self.assertEqual(kw['filter'], {})
+
+    def test_column_multiply(self):
+        kw = self.update_kwargs(
+            'UPDATE "app_post" SET "score" = (%s * "app_post"."score")',
+            [1.5])
+        self.assertEqual(kw['update'], {'$mul': {'score': 1.5}})
+
+    def test_expression_pipeline(self):
+        kw = self.update_kwargs(
+            'UPDATE "app_post" SET "views" = (("app_post"."views" * %s) - %s), '
+            '"score" = ("app_post"."score" / "app_post"."views")',
+            [2, 1])
+        self.assertEqual(kw['update'], [{'$set': {
+            'views': {'$subtract': [{'$multiply': ['$views', {'$literal': 2}]}, {'$literal': 1}]},
+            'score': {'$divide': ['$score', '$views']},
+        }}])
+
+    def test_concat_pipeline(self):
+        kw = self.update_kwargs(
+            'UPDATE "app_post" SET "title" = CONCAT("app_post"."title", %s), "views" = %s',
+            ['x', 0])
+        self.assertEqual(kw['update'], [{'$set': {
+            'title': {'$concat': ['$title', {'$literal': 'x'}]},
+            'views': {'$literal': 0},
+        }}])
+
+    def test_array_push(self):
+        value = ArrayUpdate([{'a': 1}, {'a': 2}], push=[{'a': 2}])
+        kw = self.update_kwargs(
+            'UPDATE "app_post" SET "comments" = %s, "title" = %s', [value, 'a'])
+        self.assertEqual(kw['update'], {'$push': {'comments': {'$each': [{'a': 2}]}},
+                                        '$set': {'title': 'a'}})
+
+    def test_array_pull_and_set_at(self):
+        value = ArrayUpdate([], pull=[{'a': 1}, {'a': 2}])
+        kw = self.update_kwargs('UPDATE "app_post" SET "comments" = %s', [value])
+        self.assertEqual(kw['update'], {'$pull': {'comments': {'$or': [{'a': 1}, {'a': 2}]}}})
+
+        value = ArrayUpdate([{'a': 3}], set_at={0: {'a': 3}})
+        kw = self.update_kwargs('UPDATE "app_post" SET "comments" = %s', [value])
+        self.assertEqual(kw['update'], {'$set': {'comments.0': {'a': 3}}})
+
+    def test_array_mixed_changes_rewrite(self):
+        value = ArrayUpdate([{'a': 3}], push=[{'a': 3}], pull=[{'a': 1}])
+        kw = self.update_kwargs('UPDATE "app_post" SET "comments" = %s', [value])
+        self.assertEqual(kw['update'], {'$set': {'comments': [{'a': 3}]}})
+
+    def test_array_unchanged(self):
+        value = ArrayUpdate([{'a': 1}])
+        kw = self.update_kwargs(
+            'UPDATE "app_post" SET "comments" = %s, "title" = %s', [value, 'a'])
+        self.assertEqual(kw['update'], {'$set': {'title': 'a'}})
+
+        kw = self.update_kwargs('UPDATE "app_post" SET "comments" = %s', [value])
+        self.assertEqual(kw['update'], {'$set': {'comments': [{'a': 1}]}})
+
+    def test_rowcount(self):
+        db = MagicMock()
+        db['app_post'].update_many.return_value.matched_count = 0
+        result = Parse(db, 'UPDATE "app_post" SET "title" = %s WHERE "app_post"."id" = %s', ['a', 1])
+        result.get_mongo_cur()
+        self.assertEqual(result.rowcount, 0)
+
+    def test_unacknowledged(self):
+        db = MagicMock()
+        db['app_post'].update_many.return_value = UpdateResult(None, acknowledged=False)
+        db['app_post'].delete_many.return_value = DeleteResult(None, acknowledged=False)
+
+        result = Parse(db, 'UPDATE "app_post" SET "title" = %s WHERE "app_post"."id" = %s', ['a', 1])
+        result.get_mongo_cur()
+        self.assertEqual(result.rowcount, 1)
+
+        result = Parse(db, 'DELETE FROM "app_post" WHERE "app_post"."id" = %s', [1])
+        result.get_mongo_cur()
+        self.assertEqual(result.rowcount, 1)
+
+        db['app_post'].find.return_value.sort.return_value.limit.return_value = [{'_id': 1}, {'_id': 2}]
+        self.assertEqual(ChunkedWriter(db['app_post'], batch_size=5).delete({}), 2)
+
+    def test_timeseries_meta_field_only(self):
+        meta = MagicMock(timeseries={'time_field': 'at', 'meta_field': 'source'})
+        meta.get_field.return_value.column = 'source'
+        with patch('djongo.cursor.table_meta', return_value=meta):
+            self.update_kwargs('UPDATE "app_post" SET "source" = %s', ['a'])
+            with self.assertRaises(NotSupportedError):
+                self.update_kwargs('UPDATE "app_post" SET "value" = %s', [1])
+
+    def test_capped_in_place_only(self):
+        meta = MagicMock(timeseries=None, capped={'size': 4096})
+        with patch('djongo.cursor.table_meta', return_value=meta):
+            kw = self.update_kwargs('UPDATE "app_post" SET "views" = ("app_post"."views" + %s)', [1])
+            self.assertEqual(kw['update'], {'$inc': {'views': 1}})
+            with self.assertRaises(NotSupportedError):
+                self.update_kwargs('UPDATE "app_post" SET "title" = CONCAT("app_post"."title", %s)',
+                                   ['x'])
+
+
+class TestDeleteTranslation(unittest.TestCase):
+    '''Test cases for translating DELETE statements'''
+
+    def test_in_list_deduplicated(self):
+        db = MagicMock()
+        Parse(db, 'DELETE FROM "app_post" WHERE "app_post"."id" IN (%s, %s, %s)',
+              [1, 2, 1]).get_mongo_cur()
+        self.assertEqual(db['app_post'].delete_many.call_args[1]['filter'],
+                         {'id': {'$in': [1, 2]}})
+
+    def test_capped(self):
+        db = MagicMock()
+        with patch('djongo.cursor.table_meta', return_value=MagicMock(capped={'size': 4096})):
+            with self.assertRaises(NotSupportedError):
+                Parse(db, 'DELETE FROM "app_post" WHERE "app_post"."id" = %s', [1]).get_mongo_cur()
+        db['app_post'].delete_many.assert_not_called()
+
+    def test_split_in_filter(self):
+        flt = {'$and': [{'a': 1}, {'id': {'$in': [1, 2, 3, 4, 5]}}]}
+        self.assertEqual(Parse._split_in_filter(flt, 2), [
+            {'$and': [{'a': 1}, {'id': {'$in': [1, 2]}}]},
+            {'$and': [{'a': 1}, {'id': {'$in': [3, 4]}}]},
+            {'$and': [{'a': 1}, {'id': {'$in': [5]}}]},
+        ])
+        self.assertEqual(Parse._split_in_filter(flt, 5), [flt])
+        self.assertEqual(Parse._split_in_filter({}, 5), [{}])
+
+    @patch('djongo.cursor.IN_BATCH_SIZE', 2)
+    def test_large_in_list_bulk_delete(self):
+        db = MagicMock()
+        db['app_post'].bulk_write.return_value.deleted_count = 3
+        result = Parse(db, 'DELETE FROM "app_post" WHERE "app_post"."id" IN (%s, %s, %s)',
+                       [1, 2, 3])
+        result.get_mongo_cur()
+        db['app_post'].delete_many.assert_not_called()
+        self.assertEqual(len(db['app_post'].bulk_write.call_args[0][0]), 2)
+        self.assertEqual(result.rowcount, 3)
+
+
+class TestWhereTranslation(unittest.TestCase):
+    '''Test cases for translating WHERE clauses'''
+
+    def find_kwargs(self, where, params, wrapper=None):
+        db = MagicMock()
+        Parse(db, 'SELECT "app_post"."id", "app_post"."title" FROM "app_post" WHERE ' + where,
+              params, wrapper).get_mongo_cur()
+        return db['app_post'].find.call_args[1]
+
+    def test_in_and_precedence(self):
+        kw = self.find_kwargs('("app_post"."id" IN (%s, %s) OR "app_post"."views" = %s)', [1, 2, 3])
+        self.assertEqual(kw['filter'], {'$or': [{'id': {'$in': [1, 2]}}, {'views': {'$eq': 3}}]})
+
+    def test_text_search(self):
+        kw = self.find_kwargs('"app_post"."title" MATCH %s', ['red shoe'])
+        self.assertEqual(kw['filter'], {'$text': {'$search': 'red shoe'}})
+
+    def test_text_search_merged(self):
+        kw = self.find_kwargs(
+            '(("app_post"."title" MATCH %s OR "app_post"."body" MATCH %s) '
+            'AND ("app_post"."title" MATCH %s OR "app_post"."body" MATCH %s))',
+            ['red', 'red', 'shoe', 'shoe'])
+        self.assertEqual(kw['filter']['$text'], {'$search': '"red" "shoe"'})
+
+    def test_text_score_order(self):
+        wrapper = MagicMock(write_buffer=None, query_options={'text_score': True}, settings_dict={})
+        kw = self.find_kwargs('"app_post"."title" MATCH %s', ['red'], wrapper)
+        self.assertEqual(kw['sort'], [('text_score', {'$meta': 'textScore'})])
+        self.assertEqual(kw['projection']['text_score'], {'$meta': 'textScore'})
+
+
+class TestQueryOptions(unittest.TestCase):
+    '''Test cases for write and read concern options'''
+
+    def test_write_concern(self):
+        db = MagicMock()
+        wrapper = MagicMock(write_buffer=None, query_options={},
+                            settings_dict={'OPTIONS': {'WRITE_CONCERN': {'w': 'majority'}}})
+        Parse(db, 'DELETE FROM "app_post"', [], wrapper).get_mongo_cur()
+        write_concern = db['app_post'].with_options.call_args[1]['write_concern']
+        self.assertEqual(write_concern.document, {'w': 'majority'})
+
+        wrapper.query_options = {'write_concern': {'w': 0}}
+        Parse(db, 'DELETE FROM "app_post"', [], wrapper).get_mongo_cur()
+        write_concern = db['app_post'].with_options.call_args[1]['write_concern']
+        self.assertEqual(write_concern.document, {'w': 0})
+
+    def test_read_concern(self):
+        db = MagicMock()
+        wrapper = MagicMock(write_buffer=None, query_options={'read_concern': 'majority'},
+                            settings_dict={})
+        Parse(db, 'SELECT "app_post"."id", "app_post"."title" FROM "app_post"', [], wrapper).get_mongo_cur()
+        read_concern = db['app_post'].with_options.call_args[1]['read_concern']
+        self.assertEqual(read_concern.level, 'majority')
+
+    def test_read_preference(self):
+        db = MagicMock()
+        wrapper = MagicMock(write_buffer=None, query_options={}, in_atomic_block=False,
+                            settings_dict={'OPTIONS': {'READ_PREFERENCE': {
+                                'mode': 'secondaryPreferred', 'max_staleness': 120}}})
+        sql = 'SELECT "app_post"."id", "app_post"."title" FROM "app_post"'
+        Parse(db, sql, [], wrapper).get_mongo_cur()
+        preference = db['app_post'].with_options.call_args[1]['read_preference']
+        self.assertEqual(preference.mongos_mode, 'secondaryPreferred')
+        self.assertEqual(preference.max_staleness, 120)
+
+        wrapper.in_atomic_block = True
+        Parse(db, sql, [], wrapper).get_mongo_cur()
+        preference = db['app_post'].with_options.call_args[1]['read_preference']
+        self.assertEqual(preference.mongos_mode, 'primary')
+
+    def test_max_time_ms(self):
+        db = MagicMock()
+        wrapper = MagicMock(write_buffer=None, query_options={}, in_atomic_block=False,
+                            settings_dict={'OPTIONS': {'MAX_TIME_MS': 500}})
+        sql = 'SELECT "app_post"."id", "app_post"."title" FROM "app_post"'
+        Parse(db, sql, [], wrapper).get_mongo_cur()
+        self.assertEqual(db['app_post'].find.call_args[1]['max_time_ms'], 500)
+
+        db['app_post'].count_documents.return_value = 3
+        count = Parse(db, 'SELECT COUNT(*) AS "__count" FROM "app_post"', [], wrapper).get_mongo_cur()
+        self.assertEqual(count, 3)
+        db['app_post'].count_documents.assert_called_once_with({}, maxTimeMS=500)
+
+        with deadline(0.1):
+            Parse(db, sql, [], wrapper).get_mongo_cur()
+        self.assertLessEqual(db['app_post'].find.call_args[1]['max_time_ms'], 100)
+
+        with deadline(0):
+            self.assertRaises(OperationalError, Parse(db, sql, [], wrapper).get_mongo_cur)
+
+        db['app_post'].find.side_effect = ExecutionTimeout('operation exceeded time limit')
+        cursor = Cursor(db, wrapper)
+        self.assertRaises(OperationalError, cursor.execute, sql)
+
+
+class TestPlannedStatements(unittest.TestCase):
+    '''Test cases for statements planned for the asynchronous path'''
+
+    def test_find_planned(self):
+        db = MagicMock()
+        parse = Parse(db, 'SELECT "app_post"."id", "app_post"."title" FROM "app_post" '
+                          'WHERE "app_post"."id" = %s', [1], plan=True)
+        parse.get_mongo_cur()
+        self.assertFalse(db.mock_calls)
+        self.assertEqual(parse.operation.collection, 'app_post')
+        self.assertEqual(parse.operation.method, 'find')
+        self.assertEqual(parse.operation.kwargs['filter'], {'$and': [{'id': {'$eq': 1}}]})
+
+    def test_update_planned(self):
+        db = MagicMock()
+        parse = Parse(db, 'UPDATE "app_post" SET "title" = %s', ['a'], plan=True)
+        parse.get_mongo_cur()
+        self.assertFalse(db.mock_calls)
+        self.assertEqual(parse.operation.method, 'update_many')
+        self.assertEqual(parse.operation.kwargs['update'], {'$set': {'title': 'a'}})
+
+    def test_insert_not_planned(self):
+        with self.assertRaises(NotSupportedError):
+            Parse(MagicMock(), 'INSERT INTO "app_post" ("title") VALUES (%s)', ['a'],
+                  plan=True).get_mongo_cur()
+
+
+class TestCoalescedReads(unittest.TestCase):
+    '''Test cases for single-flight coalescing of identical reads'''
+
+    def test_concurrent_reads_coalesced(self):
+        db = MagicMock()
+        db.name = 'test'
+        release = threading.Event()
+
+        def find(**kwargs):
+            release.wait()
+            return iter([{'id': 1, 'title': 'a'}])
+        db['app_post'].find.side_effect = find
+
+        wrapper = MagicMock(write_buffer=None, query_options={}, in_atomic_block=False,
+                            settings_dict={'OPTIONS': {'COALESCE_READS': True}})
+        sql = 'SELECT "app_post"."id", "app_post"."title" FROM "app_post"'
+        results = []
+
+        def read():
+            results.append(list(Parse(db, sql, [], wrapper).get_mongo_cur()))
+
+        threads = [threading.Thread(target=read) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(db['app_post'].find.call_count, 1)
+        self.assertEqual(results, [[{'id': 1, 'title': 'a'}]] * 3)
+
+    def test_followers_get_copies(self):
+        flight = SingleFlight()
+        release = threading.Event()
+
+        def fetch():
+            release.wait()
+            return [{'id': 1, 'tags': ['a']}]
+
+        results = []
+
+        def read():
+            results.append(flight.do('key', fetch))
+
+        threads = [threading.Thread(target=read) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        results[0][0]['tags'].append('b')
+        self.assertEqual([docs[0]['tags'] for docs in results[1:]], [['a'], ['a']])
+
+
+class TestResultCache(unittest.TestCase):
+    '''Test cases for caching read results'''
+
+    def test_write_invalidates(self):
+        db = MagicMock()
+        db.name = 'test'
+        db['app_post'].find.side_effect = lambda **kwargs: iter([{'id': 1, 'title': 'a'}])
+        db['app_post'].update_many.return_value.matched_count = 1
+
+        wrapper = MagicMock(write_buffer=None, query_options={}, in_atomic_block=False,
+                            settings_dict={'OPTIONS': {'RESULT_CACHE': {
+                                'BACKEND': 'djongo.cache.LocMemResultCache',
+                                'MAX_ENTRIES': 10,
+                            }}})
+        sql = 'SELECT "app_post"."id", "app_post"."title" FROM "app_post"'
+
+        for i in range(2):
+            self.assertEqual(list(Parse(db, sql, [], wrapper).get_mongo_cur()),
+                             [{'id': 1, 'title': 'a'}])
+        self.assertEqual(db['app_post'].find.call_count, 1)
+
+        Parse(db, 'UPDATE "app_post" SET "title" = %s WHERE "app_post"."id" = %s',
+              ['b', 1], wrapper).get_mongo_cur()
+        list(Parse(db, sql, [], wrapper).get_mongo_cur())
+        self.assertEqual(db['app_post'].find.call_count, 2)
+
+        wrapper.query_options = {'cache_results': False}
+        list(Parse(db, sql, [], wrapper).get_mongo_cur())
+        self.assertEqual(db['app_post'].find.call_count, 3)
+
+    def test_rows_not_shared(self):
+        db = MagicMock()
+        db.name = 'test'
+        db['app_post'].find.side_effect = lambda **kwargs: iter([{'id': 1, 'tags': ['a']}])
+
+        wrapper = MagicMock(write_buffer=None, query_options={}, in_atomic_block=False,
+                            settings_dict={'OPTIONS': {'RESULT_CACHE': {
+                                'BACKEND': 'djongo.cache.LocMemResultCache',
+                                'MAX_ENTRIES': 11,
+                            }}})
+        sql = 'SELECT "app_post"."id", "app_post"."tags" FROM "app_post"'
+
+        for i in range(2):
+            doc, = Parse(db, sql, [], wrapper).get_mongo_cur()
+            self.assertEqual(doc, {'id': 1, 'tags': ['a']})
+            doc['tags'].append('b')
+            doc['id'] = 2
+        self.assertEqual(db['app_post'].find.call_count, 1)
+
+
+class TestJoins(unittest.TestCase):
+    '''Test cases for joins, with $lookup or against pinned tables'''
+
+    sql = ('SELECT "app_post"."title", "app_blog"."name" FROM "app_post" '
+           'INNER JOIN "app_blog" ON ("app_post"."blog_id" = "app_blog"."id")')
+
+    def test_lookup(self):
+        db = MagicMock()
+        wrapper = MagicMock(write_buffer=None, query_options={}, settings_dict={})
+        Parse(db, self.sql, [], wrapper).get_mongo_cur()
+
+        pipeline = db['app_post'].aggregate.call_args[0][0]
+        self.assertEqual(pipeline[0], {'$lookup': {'from': 'app_blog', 'localField': 'blog_id',
+                                                   'foreignField': 'id', 'as': 'app_blog'}})
+
+    def test_pinned(self):
+        db = MagicMock()
+        db.name = 'test_pinned'
+        db['__pinned__'].find_one.return_value = None
+        db['app_blog'].find.return_value = [{'id': 1, 'name': 'a'}, {'id': 2, 'name': 'b'}]
+        db['app_post'].aggregate.return_value = iter([
+            {'app_post': {'title': 'x', 'blog_id': 2}},
+            {'app_post': {'title': 'y', 'blog_id': 3}},
+        ])
+        wrapper = MagicMock(write_buffer=None, query_options={}, in_atomic_block=False,
+                            settings_dict={'OPTIONS': {'PINNED_TABLES': ['app_blog']}})
+
+        parse = Parse(db, self.sql, [], wrapper)
+        rows = [parse.parse_result(doc) for doc in parse.get_mongo_cur()]
+        self.assertEqual(rows, [('x', 'b')])
+        pipeline = db['app_post'].aggregate.call_args[0][0]
+        self.assertEqual(pipeline, [{'$project': {'app_post.title': '$title',
+                                                  'app_post.blog_id': '$blog_id',
+                                                  '_id': False}}])
+
+    def test_pinned_filtered(self):
+        db = MagicMock()
+        wrapper = MagicMock(write_buffer=None, query_options={}, in_atomic_block=False,
+                            settings_dict={'OPTIONS': {'PINNED_TABLES': ['app_blog']}})
+        for where, lookup in (('"app_blog"."name" = %s', True),
+                              ('("app_post"."title" = %s OR "app_blog"."name" = %s)', True),
+                              ('"app_post"."title" = %s', False)):
+            db.reset_mock()
+            sql = self.sql + ' WHERE ' + where
+            Parse(db, sql, ['a'] * where.count('%s'), wrapper).get_mongo_cur()
+            pipeline = db['app_post'].aggregate.call_args[0][0]
+            self.assertEqual('$lookup' in pipeline[0], lookup, where)
+
+        db.reset_mock()
+        Parse(db, self.sql + ' ORDER BY "app_blog"."name" ASC', [], wrapper).get_mongo_cur()
+        self.assertIn('$lookup', db['app_post'].aggregate.call_args[0][0][0])
+
+    def test_pinned_rows_copied(self):
+        db = MagicMock()
+        db.name = 'test_pinned_rows'
+        db['__pinned__'].find_one.return_value = None
+        db['app_blog'].find.return_value = [{'id': 1, 'tags': ['a']}]
+        db['app_post'].aggregate.side_effect = lambda *args, **kwargs: iter([
+            {'title': 'x', 'blog_id': 1},
+            {'title': 'y', 'blog_id': 1},
+        ])
+        wrapper = MagicMock(write_buffer=None, query_options={}, in_atomic_block=False,
+                            settings_dict={'OPTIONS': {'PINNED_TABLES': ['app_blog']}})
+        sql = ('SELECT * FROM "app_post" '
+               'INNER JOIN "app_blog" ON ("app_post"."blog_id" = "app_blog"."id")')
+
+        rows = list(Parse(db, sql, [], wrapper).get_mongo_cur())
+        rows[0]['app_blog']['tags'].append('b')
+        self.assertEqual(rows[1]['app_blog'], {'id': 1, 'tags': ['a']})
+
+        rows = list(Parse(db, sql, [], wrapper).get_mongo_cur())
+        self.assertEqual(rows[0]['app_blog'], {'id': 1, 'tags': ['a']})
+        self.assertEqual(db['app_blog'].find.call_count, 1)
+
+
+class TestChunkedWriter(unittest.TestCase):
+    '''Test cases for batched mass writes'''
+
+    def test_delete_in_batches(self):
+        coll = MagicMock()
+        batches = [[{'_id': 1}, {'_id': 2}], [{'_id': 3}, {'_id': 4}], [{'_id': 5}]]
+        coll.find.return_value.sort.return_value.limit.side_effect = batches
+        coll.delete_many.return_value.deleted_count = 2
+        progress = MagicMock()
+
+        writer = ChunkedWriter(coll, batch_size=2, progress=progress)
+        self.assertEqual(writer.delete({'a': 1}), 6)
+
+        self.assertEqual(coll.delete_many.call_count, 3)
+        self.assertEqual(coll.delete_many.call_args_list[1][0][0],
+                         {'$and': [{'_id': {'$in': [3, 4]}}, {'a': 1}]})
+        self.assertEqual(coll.find.call_args_list[2][0][0],
+                         {'$and': [{'a': 1}, {'_id': {'$gt': 4}}]})
+        self.assertEqual(progress.call_count, 3)
+
+    def test_replication_lag_standalone(self):
+        coll = MagicMock()
+        coll.database.client.admin.command.side_effect = PyMongoError
+        self.assertEqual(ChunkedWriter(coll).replication_lag(), 0)
+
+
+class TestWriteBuffer(unittest.TestCase):
+    '''Test cases for buffering writes inside atomic blocks'''
+
+    def collections(self):
+        colls = {}
+
+        def get_collection(name):
+            if name not in colls:
+                colls[name] = MagicMock()
+                colls[name].name = name
+            return colls[name]
+
+        db = MagicMock()
+        db.__getitem__.side_effect = get_collection
+        return db, colls
+
+    def test_buffered_writes(self):
+        db, colls = self.collections()
+        buffer = WriteBuffer(db)
+        wrapper = MagicMock(write_buffer=buffer, query_options={}, settings_dict={})
+        calls = []
+        for name in ('app_post', 'app_tag'):
+            coll = db[name]
+            coll.bulk_write.side_effect = lambda ops, name=name, **kwargs: calls.append(('bulk_write', name)) \
+                or MagicMock()
+            coll.update_many.side_effect = lambda **kwargs: calls.append(('update_many', 'app_post')) \
+                or UpdateResult({'n': 4}, True)
+            coll.delete_many.side_effect = lambda *args, **kwargs: calls.append(('delete_many', 'app_tag')) \
+                or DeleteResult({'n': 2}, True)
+
+        buffer.add(colls['app_post'], InsertOne({'title': 'a'}))
+        buffer.add(colls['app_tag'], InsertOne({'name': 'b'}))
+        parse = Parse(db, 'UPDATE "app_post" SET "title" = %s', ['a'], wrapper)
+        parse.get_mongo_cur()
+        self.assertEqual(parse.rowcount, 4)
+
+        buffer.add(colls['app_tag'], InsertOne({'name': 'c'}))
+        parse = Parse(db, 'DELETE FROM "app_tag" WHERE "app_tag"."id" = %s', [1], wrapper)
+        parse.get_mongo_cur()
+        self.assertEqual(parse.rowcount, 2)
+
+        # The queued inserts are sent first, in order
+        self.assertEqual(calls, [('bulk_write', 'app_post'), ('bulk_write', 'app_tag'),
+                                 ('update_many', 'app_post'),
+                                 ('bulk_write', 'app_tag'), ('delete_many', 'app_tag')])
+        self.assertEqual(buffer.ops, [])
+
+    def test_queryset_delete(self):
+        db = mock_db()
+        db.name = 'djongo_unit'
+        db['tests_blog'].find.side_effect = lambda **kwargs: ResultCursor(
+            [{'id': i, 'name': 'a', 'views': 0, 'modified': None} for i in (1, 2, 3)])
+        db['tests_blogentry'].find.side_effect = lambda **kwargs: ResultCursor([])
+        db['tests_subscriber'].delete_many.return_value = DeleteResult({'n': 0}, True)
+        db['tests_blog'].delete_many.return_value = DeleteResult({'n': 3}, True)
+        connection.connection = db
+        # As connect() leaves it, so that atomic() turns it off
+        connection.autocommit = True
+        self.addCleanup(setattr, connection, 'connection', None)
+        self.addCleanup(setattr, connection, 'autocommit', False)
+
+        with patch.dict(connection.settings_dict['OPTIONS'], BUFFER_WRITES=True):
+            deleted, counts = Blog.objects.filter(name='a').delete()
+        self.assertEqual(deleted, 3)
+        self.assertEqual(counts['tests.Blog'], 3)
+        self.assertFalse(counts.get('tests.Subscriber'))
+
+    def test_discard(self):
+        db = MagicMock()
+        buffer = WriteBuffer(db)
+        buffer.add('app_post', None)
+        buffer.discard()
+        buffer.flush()
+        db.__getitem__.return_value.bulk_write.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
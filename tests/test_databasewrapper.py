@@ -1,6 +1,7 @@
 import unittest
 from unittest.mock import patch, MagicMock
 
+from djongo import base
 from djongo.base import DatabaseWrapper
 
 
@@ -47,5 +48,81 @@ class TestDatabaseWrapper(unittest.TestCase):
 
         mocked_mongoclient.assert_called_once()
 
+    def test_client_options(self):
+        wrapper = DatabaseWrapper({'OPTIONS': {'maxPoolSize': 50, 'compressors': 'zstd',
+                                               'BUFFER_WRITES': True}})
+        params = wrapper.get_connection_params()
+        self.assertEqual(params['maxPoolSize'], 50)
+        self.assertEqual(params['compressors'], 'zstd')
+        self.assertNotIn('BUFFER_WRITES', params)
+
+    @patch('djongo.base.MongoClient')
+    def test_shared_client(self, mocked_mongoclient):
+        settings_dict = {'NAME': 'shared', 'OPTIONS': {'appname': 'test_shared_client'}}
+        for i in range(3):
+            wrapper = DatabaseWrapper(settings_dict)
+            wrapper.get_new_connection(wrapper.get_connection_params())
+            wrapper._close()
+
+        mocked_mongoclient.assert_called_once()
+        mocked_mongoclient.return_value.close.assert_not_called()
+
+    @patch('djongo.base.MongoClient')
+    def test_reset_after_fork(self, mocked_mongoclient):
+        settings_dict = {'NAME': 'forked', 'OPTIONS': {'appname': 'test_reset_after_fork'}}
+        wrapper = DatabaseWrapper(settings_dict)
+        wrapper.get_new_connection(wrapper.get_connection_params())
+
+        base._reset_after_fork()
+        wrapper.get_new_connection(wrapper.get_connection_params())
+        self.assertEqual(mocked_mongoclient.call_count, 2)
+
+    def test_buffer_writes(self):
+        wrapper = DatabaseWrapper({'OPTIONS': {'BUFFER_WRITES': True}})
+        wrapper.connection = MagicMock()
+
+        wrapper._set_autocommit(False)
+        self.assertIsNotNone(wrapper.write_buffer)
+        wrapper._rollback()
+        wrapper._set_autocommit(True)
+        self.assertIsNone(wrapper.write_buffer)
+
+        wrapper = DatabaseWrapper({})
+        wrapper._set_autocommit(False)
+        self.assertIsNone(wrapper.write_buffer)
+
+    def test_flush(self):
+        wrapper = DatabaseWrapper({})
+        wrapper.connection = MagicMock()
+
+        sql_list = wrapper.ops.sql_flush(None, ['app_post', 'app_tag'], [])
+        self.assertEqual(sql_list, ['DELETE FROM "app_post"', 'DELETE FROM "app_tag"'])
+
+        wrapper.ops.execute_sql_flush('default', sql_list)
+        wrapper.connection['app_post'].delete_many.assert_called_with({})
+        wrapper.connection['__schema__'].update_many.assert_called_once_with(
+            {'name': {'$in': ['app_post', 'app_tag']}},
+            {'$set': {'auto.seq': 0}}
+        )
+
+    def test_flush_capped(self):
+        wrapper = DatabaseWrapper({})
+        wrapper.connection = MagicMock()
+        capped = wrapper.connection['tests_logentry']
+        capped.options.return_value = {'capped': True, 'size': 4096, 'max': 100}
+        capped.list_indexes.return_value = [
+            {'v': 2, 'key': {'_id': 1}, 'name': '_id_'},
+            {'v': 2, 'key': {'message': 1}, 'name': 'message_idx'},
+        ]
+
+        wrapper.ops.execute_sql_flush('default', ['DELETE FROM "tests_logentry"'])
+        capped.delete_many.assert_not_called()
+        wrapper.connection.drop_collection.assert_called_once_with('tests_logentry')
+        wrapper.connection.create_collection.assert_called_once_with(
+            'tests_logentry', capped=True, size=4096, max=100)
+        indexes = capped.create_indexes.call_args[0][0]
+        self.assertEqual([index.document['name'] for index in indexes], ['message_idx'])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,46 @@
+import time
+import unittest
+
+from django.test import override_settings
+
+from djongo.deadline import deadline, remaining_ms, DeadlineMiddleware
+
+
+class TestDeadline(unittest.TestCase):
+    '''Test cases for the time budgets of requests'''
+
+    def test_nested(self):
+        self.assertIsNone(remaining_ms())
+        with deadline(10):
+            self.assertGreater(remaining_ms(), 9000)
+            with deadline(0.5):
+                self.assertLessEqual(remaining_ms(), 500)
+            with deadline(60):
+                self.assertLessEqual(remaining_ms(), 10000)
+        self.assertIsNone(remaining_ms())
+
+    def test_expired(self):
+        with deadline(0.01):
+            time.sleep(0.02)
+            self.assertLess(remaining_ms(), 0)
+
+    def test_middleware(self):
+        budgets = []
+
+        def get_response(request):
+            budgets.append(remaining_ms())
+            return 'response'
+
+        with override_settings(DJONGO_REQUEST_TIMEOUT=2):
+            middleware = DeadlineMiddleware(get_response)
+        self.assertEqual(middleware('request'), 'response')
+        self.assertTrue(1000 < budgets[0] <= 2000)
+
+        middleware = DeadlineMiddleware(get_response)
+        middleware('request')
+        self.assertTrue(29000 < budgets[1] <= 30000)
+        self.assertIsNone(remaining_ms())
+
+
+if __name__ == '__main__':
+    unittest.main()
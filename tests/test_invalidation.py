@@ -0,0 +1,108 @@
+import unittest
+from unittest.mock import patch, MagicMock, PropertyMock
+
+from djongo.invalidation import ChangeStreamInvalidator, RESUME_TOKENS
+
+
+class TestChangeStreamInvalidator(unittest.TestCase):
+    '''Test cases for publishing change stream events'''
+
+    def setUp(self):
+        patcher = patch('djongo.invalidation.connections')
+        connections = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.db = connections['default'].connection
+        self.db.name = 'test'
+        connections['default'].settings_dict = {}
+
+    def test_handle(self):
+        invalidator = ChangeStreamInvalidator(name='workers')
+        callback = invalidator.register(MagicMock())
+
+        invalidator.handle({'_id': {'_data': '01'}, 'operationType': 'update',
+                            'ns': {'db': 'test', 'coll': 'app_post'},
+                            'documentKey': {'_id': 7}})
+        invalidator.handle({'_id': {'_data': '02'}, 'operationType': 'drop',
+                            'ns': {'db': 'test', 'coll': 'app_tag'}})
+        invalidator.handle({'_id': {'_data': '03'}, 'operationType': 'rename',
+                            'ns': {'db': 'test', 'coll': 'app_note'},
+                            'to': {'db': 'test', 'coll': 'app_memo'}})
+
+        self.assertEqual([call[0] for call in callback.call_args_list], [
+            ('app_post', [7]),
+            ('app_tag', None),
+            ('app_note', None),
+            ('app_memo', None),
+        ])
+        self.db[RESUME_TOKENS].update_one.assert_not_called()
+
+        invalidator.flush_token()
+        self.db[RESUME_TOKENS].update_one.assert_called_once_with(
+            {'_id': 'workers'}, {'$set': {'token': {'_data': '03'}}}, upsert=True)
+
+    def test_save_every(self):
+        invalidator = ChangeStreamInvalidator(save_every=2, save_interval=60)
+        for i in range(3):
+            invalidator.handle({'_id': {'_data': str(i)}, 'operationType': 'delete',
+                                'ns': {'db': 'test', 'coll': 'app_post'},
+                                'documentKey': {'_id': i}})
+        self.db[RESUME_TOKENS].update_one.assert_called_once_with(
+            {'_id': 'default'}, {'$set': {'token': {'_data': '1'}}}, upsert=True)
+
+        invalidator.handle({'_id': {'_data': '3'}, 'operationType': 'invalidate'})
+        self.db[RESUME_TOKENS].update_one.assert_called_with(
+            {'_id': 'default'}, {'$set': {'token': None}}, upsert=True)
+        invalidator.flush_token()
+        self.assertEqual(self.db[RESUME_TOKENS].update_one.call_count, 2)
+
+    def test_save_interval(self):
+        invalidator = ChangeStreamInvalidator(save_every=100, save_interval=5)
+        change = {'_id': {'_data': '01'}, 'operationType': 'delete',
+                  'ns': {'db': 'test', 'coll': 'app_post'}, 'documentKey': {'_id': 1}}
+        with patch('djongo.invalidation.time.monotonic', return_value=invalidator.saved_at + 1):
+            invalidator.handle(change)
+        self.db[RESUME_TOKENS].update_one.assert_not_called()
+        with patch('djongo.invalidation.time.monotonic', return_value=invalidator.saved_at + 6):
+            invalidator.handle(dict(change, _id={'_data': '02'}))
+        self.db[RESUME_TOKENS].update_one.assert_called_once_with(
+            {'_id': 'default'}, {'$set': {'token': {'_data': '02'}}}, upsert=True)
+
+    def test_drop_database(self):
+        self.db.list_collection_names.return_value = ['app_post', 'app_tag', RESUME_TOKENS]
+        stream = self.db.watch.return_value.__enter__.return_value
+        type(stream).alive = PropertyMock(side_effect=[True, False])
+        stream.try_next.return_value = {'_id': {'_data': '01'}, 'operationType': 'dropDatabase',
+                                        'ns': {'db': 'test'}}
+
+        invalidator = ChangeStreamInvalidator()
+        callback = invalidator.register(MagicMock())
+        invalidator._watch()
+
+        self.assertEqual([call[0] for call in callback.call_args_list],
+                         [('app_post', None), ('app_tag', None)])
+        # Saved when the stream closes
+        self.db[RESUME_TOKENS].update_one.assert_called_once_with(
+            {'_id': 'default'}, {'$set': {'token': {'_data': '01'}}}, upsert=True)
+
+        invalidator = ChangeStreamInvalidator(collections=['app_post'])
+        callback = invalidator.register(MagicMock())
+        invalidator.handle(stream.try_next.return_value)
+        callback.assert_called_once_with('app_post', None)
+
+    def test_resume(self):
+        self.db[RESUME_TOKENS].find_one.return_value = {'_id': 'default', 'token': {'_data': '01'}}
+        stream = self.db.watch.return_value.__enter__.return_value
+        stream.alive = False
+
+        invalidator = ChangeStreamInvalidator(collections=['app_post'])
+        invalidator._watch()
+
+        match = self.db.watch.call_args[0][0][0]['$match']
+        self.assertIn({'ns.coll': {'$in': ['app_post']}}, match['$or'])
+        self.assertIn({'to.coll': {'$in': ['app_post']}}, match['$or'])
+        self.assertEqual(self.db.watch.call_args[1]['resume_after'], {'_data': '01'})
+        self.db[RESUME_TOKENS].update_one.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+from io import StringIO
+
+from django.core.management import call_command, CommandError
+from django.db import connection
+from pymongo import ASCENDING
+
+from djongo.management.commands.refresh_views import Command
+from djongo.materialized import MaterializedView, materialized_views, WATERMARKS
+from .models import AuthorViews
+from .utils import mock_db
+
+
+class TestMaterializedView(unittest.TestCase):
+    '''Test cases for refreshing materialized views'''
+
+    def setUp(self):
+        self.db = mock_db()
+        self.db['tests_article'].find_one.return_value = {'id': 10}
+        self.db[WATERMARKS].find_one.return_value = None
+        connection.connection = self.db
+
+    def tearDown(self):
+        connection.connection = None
+
+    def pipeline(self):
+        return self.db['tests_article'].aggregate.call_args[0][0]
+
+    def test_full_refresh(self):
+        self.assertEqual(MaterializedView(AuthorViews).refresh(), 10)
+
+        pipeline = self.pipeline()
+        self.assertEqual(pipeline[0], {'$match': {'id': {'$lte': 10}}})
+        self.assertEqual(pipeline[-1], {'$out': 'tests_authorviews'})
+        self.db[WATERMARKS].update_one.assert_called_once_with(
+            {'_id': 'tests_authorviews'}, {'$set': {'watermark': 10}}, upsert=True)
+
+    def test_incremental_refresh(self):
+        self.db[WATERMARKS].find_one.return_value = {'_id': 'tests_authorviews', 'watermark': 4}
+        MaterializedView(AuthorViews).refresh()
+
+        pipeline = self.pipeline()
+        self.assertEqual(pipeline[0], {'$match': {'id': {'$gt': 4, '$lte': 10}}})
+        self.assertEqual(pipeline[-1], {'$merge': {
+            'into': 'tests_authorviews',
+            'on': ['author'],
+            'whenMatched': AuthorViews._meta.materialized_view['when_matched'],
+            'whenNotMatched': 'insert',
+        }})
+        self.db['tests_authorviews'].create_index.assert_called_once_with(
+            [('author', ASCENDING)], unique=True)
+
+        MaterializedView(AuthorViews).refresh(full=True)
+        self.assertEqual(self.pipeline()[-1], {'$out': 'tests_authorviews'})
+
+    def test_up_to_date(self):
+        self.db[WATERMARKS].find_one.return_value = {'_id': 'tests_authorviews', 'watermark': 10}
+        self.assertEqual(MaterializedView(AuthorViews).refresh(), 10)
+        self.db['tests_article'].aggregate.assert_not_called()
+
+    def test_command(self):
+        self.assertEqual(materialized_views(), [AuthorViews])
+
+        out = StringIO()
+        call_command(Command(), 'tests.AuthorViews', stdout=out)
+        self.assertEqual(out.getvalue(), 'Refreshed tests.AuthorViews up to 10\n')
+        self.db['tests_article'].aggregate.assert_called_once()
+
+        with self.assertRaises(CommandError):
+            call_command(Command(), 'tests.Article')
+        with self.assertRaises(CommandError):
+            call_command(Command(), 'tests.Missing')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,318 @@
+import copy
+import datetime
+import pickle
+import threading
+import unittest
+from unittest.mock import patch
+
+from django.core.exceptions import FieldError
+from django.db import connection
+from django.db.models import Model, Prefetch
+
+from djongo.cursor import ArrayUpdate, ResultCursor
+from djongo.models import MongoIndex, ArrayModelList
+from .models import Blog, Tag, Entry, Post, Comment
+from .utils import mock_db
+
+
+class TestMongoIndex(unittest.TestCase):
+    '''Test cases for the MongoDB specific index options'''
+
+    def test_options(self):
+        index = MongoIndex(fields=['owner'], name='owner_partial', unique=True,
+                           partial_filter={'owner': {'$exists': True}},
+                           collation={'locale': 'en', 'strength': 2})
+        options = index.mongo_options()
+        self.assertEqual(options['partialFilterExpression'], {'owner': {'$exists': True}})
+        self.assertTrue(options['unique'])
+        self.assertEqual(options['collation'].document, {'locale': 'en', 'strength': 2})
+
+    def test_deconstruct(self):
+        index = MongoIndex(fields=['expires'], name='expires_ttl', expire_after_seconds=0)
+        path, args, kwargs = index.deconstruct()
+        self.assertEqual(path, 'djongo.models.MongoIndex')
+        self.assertEqual(kwargs, {'fields': ['expires'], 'name': 'expires_ttl',
+                                  'expire_after_seconds': 0})
+        self.assertEqual(MongoIndex(**kwargs), index)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            MongoIndex(fields=['a', 'b'], name='ab', expire_after_seconds=10)
+        with self.assertRaises(ValueError):
+            MongoIndex(fields=['comments.text'])
+        with self.assertRaises(ValueError):
+            MongoIndex(fields=['a'], name='a', index_type='btree')
+
+
+class TestUpsert(unittest.TestCase):
+    '''Test cases for DjongoManager.upsert and get_or_upsert'''
+
+    def setUp(self):
+        self.db = mock_db()
+        self.db['__schema__'].find_one_and_update.return_value = {
+            'name': 'tests_blog', 'auto': {'field_name': 'id', 'seq': 7}}
+        connection.connection = self.db
+
+    def tearDown(self):
+        connection.connection = None
+
+    def test_create(self):
+        self.db['tests_blog'].find_one_and_update.return_value = None
+        obj, created = Blog.objects.upsert(name='a', defaults={'views': 3})
+
+        self.assertTrue(created)
+        self.assertEqual(obj.pk, 7)
+        self.db['tests_blog'].find_one_and_update.assert_called_once()
+        flt, update = self.db['tests_blog'].find_one_and_update.call_args[0]
+        self.assertEqual(flt, {'name': 'a'})
+        self.assertEqual(update['$set']['views'], 3)
+        self.assertIn('modified', update['$set'])
+        self.assertEqual(update['$setOnInsert'], {'id': 7})
+        self.assertTrue(self.db['tests_blog'].find_one_and_update.call_args[1]['upsert'])
+
+    def test_update(self):
+        self.db['tests_blog'].find_one_and_update.return_value = {
+            'id': 3, 'name': 'a', 'views': 1, 'modified': datetime.datetime(2020, 1, 1)}
+        obj, created = Blog.objects.upsert(name='a', defaults={'views': 3})
+
+        self.assertFalse(created)
+        self.assertEqual(obj.pk, 3)
+        self.assertEqual(obj.views, 3)
+        self.db['tests_blog'].find_one_and_update.assert_called_once()
+
+    def test_race(self):
+        # The second call matches the document inserted by the first
+        self.db['tests_blog'].find_one_and_update.side_effect = [
+            None, {'id': 7, 'name': 'a', 'views': 0, 'modified': datetime.datetime(2020, 1, 1)}]
+        first, created = Blog.objects.get_or_upsert(name='a')
+        self.assertTrue(created)
+        second, created = Blog.objects.get_or_upsert(name='a')
+        self.assertFalse(created)
+        self.assertEqual(second.pk, first.pk)
+
+        update = self.db['tests_blog'].find_one_and_update.call_args[0][1]
+        self.assertNotIn('$set', update)
+
+    def test_no_auto_entry(self):
+        self.db['__schema__'].find_one_and_update.return_value = None
+        self.db['tests_blog'].find_one_and_update.return_value = None
+        Blog.objects.get_or_upsert(name='a')
+        update = self.db['tests_blog'].find_one_and_update.call_args[0][1]
+        self.assertNotIn('id', update['$setOnInsert'])
+
+    def test_natural_key(self):
+        self.db['tests_tag'].find_one_and_update.return_value = None
+        obj, created = Tag.objects.upsert(slug='x', defaults={'count': 1})
+        self.assertTrue(created)
+        self.db['__schema__'].find_one_and_update.assert_not_called()
+
+    def test_lookups(self):
+        with self.assertRaises(FieldError):
+            Blog.objects.upsert(name__iexact='a')
+
+    def test_pinned_written(self):
+        self.db.name = 'djongo_unit'
+        self.db['tests_blog'].find_one_and_update.return_value = None
+        with patch.dict(connection.settings_dict['OPTIONS'], PINNED_TABLES=['tests_blog']), \
+                patch('djongo.cursor.pinned_tables.discard') as discard:
+            Blog.objects.upsert(name='a', defaults={'views': 42})
+        discard.assert_called_once_with('djongo_unit', 'tests_blog')
+        self.db['__pinned__'].update_one.assert_called_once_with(
+            {'_id': 'tests_blog'}, {'$inc': {'version': 1}}, upsert=True)
+
+    def test_result_cache(self):
+        self.db.name = 'djongo_unit'
+        self.db['tests_blog'].find.side_effect = lambda **kwargs: iter([{'name': 'a', 'views': 0}])
+        self.db['tests_blog'].find_one_and_update.return_value = {
+            'id': 3, 'name': 'a', 'views': 0, 'modified': datetime.datetime(2020, 1, 1)}
+        config = {'BACKEND': 'djongo.cache.LocMemResultCache', 'TIMEOUT': 8}
+        with patch.dict(connection.settings_dict['OPTIONS'], RESULT_CACHE=config):
+            def read():
+                list(Blog.objects.values_list('name', 'views'))
+                return self.db['tests_blog'].find.call_count
+
+            self.assertEqual(read(), 1)
+            self.assertEqual(read(), 1)
+
+            Blog.objects.upsert(name='a', defaults={'views': 42})
+            self.assertEqual(read(), 2)
+
+            # Matching an existing document writes nothing
+            Blog.objects.get_or_upsert(name='a')
+            self.assertEqual(read(), 2)
+
+            self.db['tests_blog'].find_one_and_update.return_value = None
+            Blog.objects.get_or_upsert(name='b')
+            self.assertEqual(read(), 3)
+
+
+class TestWriteConcern(unittest.TestCase):
+    '''Test cases for the write concern of inserts made through querysets'''
+
+    def setUp(self):
+        self.db = mock_db()
+        self.db['__schema__'].find_one_and_update.return_value = {
+            'name': 'tests_blog', 'auto': {'field_name': 'id', 'seq': 7}}
+        connection.connection = self.db
+
+    def tearDown(self):
+        connection.connection = None
+
+    def write_concern(self):
+        return self.db['tests_blog'].with_options.call_args[1]['write_concern'].document
+
+    def test_create(self):
+        blog = Blog.objects.using_write_concern(w=0).create(name='a')
+        self.assertEqual(blog.pk, 7)
+        self.assertEqual(self.write_concern(), {'w': 0})
+        self.db['tests_blog'].with_options.return_value.insert_one.assert_called_once()
+
+    def test_get_or_create(self):
+        self.db['tests_blog'].find.return_value = ResultCursor([])
+        Blog.objects.using_write_concern(w=0).get_or_create(name='a')
+        self.assertEqual(self.write_concern(), {'w': 0})
+        self.db['tests_blog'].with_options.return_value.insert_one.assert_called_once()
+
+    def test_upsert(self):
+        collection = self.db['tests_blog'].with_options.return_value
+        collection.find_one_and_update.return_value = None
+        Blog.objects.using_write_concern(w=0).upsert(name='a', defaults={'views': 1})
+        self.assertEqual(self.write_concern(), {'w': 0})
+        collection.find_one_and_update.assert_called_once()
+        self.db['tests_blog'].find_one_and_update.assert_not_called()
+
+
+class TestDirtyFields(unittest.TestCase):
+    '''Test cases for saving only the changed columns'''
+
+    def setUp(self):
+        self.db = mock_db()
+        connection.connection = self.db
+        self.entry = Entry.from_db('default', ['id', 'headline', 'body', 'modified'],
+                                   [1, 'h', 'b', datetime.datetime(2020, 1, 1)])
+
+    def tearDown(self):
+        connection.connection = None
+
+    def test_dirty_fields(self):
+        self.assertEqual(self.entry.get_dirty_fields(), [])
+        self.entry.headline = 'g'
+        self.assertEqual(self.entry.get_dirty_fields(), ['headline'])
+        self.assertEqual(Entry(headline='n').get_dirty_fields(),
+                         ['id', 'headline', 'body', 'modified'])
+
+    def test_save_changed_columns(self):
+        self.db['tests_entry'].update_many.return_value.matched_count = 1
+        self.entry.headline = 'g'
+        self.entry.save()
+
+        update = self.db['tests_entry'].update_many.call_args[1]['update']
+        self.assertEqual(set(update['$set']), {'headline', 'modified'})
+        self.assertEqual(update['$set']['headline'], 'g')
+        self.assertEqual(self.entry.get_dirty_fields(), [])
+
+    def test_auto_now(self):
+        with patch.object(Model, 'save') as save:
+            self.entry.body = 'c'
+            self.entry.save()
+            self.assertEqual(save.call_args[1]['update_fields'], ['body', 'modified'])
+
+            self.entry.save()
+            self.assertIsNone(save.call_args[1]['update_fields'])
+
+
+class TestArrayModelField(unittest.TestCase):
+    '''Test cases for the incremental saves of tracked arrays'''
+
+    def test_opt_in(self):
+        field = Post._meta.get_field('history')
+        value = field.from_db_value([{'text': 'a'}], None, connection, None)
+        self.assertNotIsInstance(value, ArrayModelList)
+        self.assertEqual(field.get_db_prep_save(value, connection), [{'text': 'a'}])
+
+    def test_tracked(self):
+        field = Post._meta.get_field('comments')
+        value = field.from_db_value([{'text': 'a'}], None, connection, None)
+        self.assertIsInstance(value, ArrayModelList)
+
+        prep = field.get_db_prep_save(value, connection)
+        self.assertIsInstance(prep, ArrayUpdate)
+        self.assertTrue(prep.unchanged)
+
+        value.append(Comment(text='b'))
+        prep = field.get_db_prep_save(value, connection)
+        self.assertEqual(prep.push, [{'text': 'b'}])
+
+        # Lists built by the caller are rewritten
+        value = ArrayModelList([Comment(text='a')])
+        self.assertEqual(field.get_db_prep_save(value, connection), [{'text': 'a'}])
+
+    def test_copies(self):
+        value = ArrayModelList([1, 2])
+        value.reset_ops()
+        value.append(3)
+        value.update_at(0, 0)
+
+        for copied in (pickle.loads(pickle.dumps(value)), copy.deepcopy(value), copy.copy(value)):
+            self.assertIsInstance(copied, ArrayModelList)
+            self.assertEqual(copied, [0, 2, 3])
+            self.assertEqual(copied._push, [3])
+            self.assertEqual(copied._set_at, {0: 0})
+            self.assertFalse(copied._rewrite)
+
+            copied.append(4)
+            self.assertEqual(value._push, [3])
+
+        value = ArrayModelList([1])
+        self.assertTrue(pickle.loads(pickle.dumps(value))._rewrite)
+
+
+class TestParallelPrefetch(unittest.TestCase):
+    '''Test cases for running prefetch_related lookups concurrently'''
+
+    def setUp(self):
+        self.calls = []
+        self.lock = threading.Lock()
+        # Both groups must be prefetching at the same time to get through
+        self.barrier = threading.Barrier(2, timeout=5)
+
+    def prefetch(self, instances, *lookups):
+        with self.lock:
+            self.calls.append((threading.get_ident(), lookups))
+        self.barrier.wait()
+
+    def run_prefetch(self, qs):
+        qs._result_cache = [Blog(pk=1), Blog(pk=2)]
+        with patch('djongo.models.prefetch_related_objects', side_effect=self.prefetch), \
+                patch('django.db.models.query.prefetch_related_objects') as sequential, \
+                patch('djongo.models.connections.close_all'):
+            qs._prefetch_related_objects()
+        return qs, sequential
+
+    def test_groups(self):
+        qs, sequential = self.run_prefetch(
+            Blog.objects.prefetch_related(
+                'entries', Prefetch('entries__tags'), 'subscribers'
+            ).parallel_prefetch(2))
+
+        sequential.assert_not_called()
+        self.assertEqual(sorted(lookups for _, lookups in self.calls),
+                         sorted([('entries', Prefetch('entries__tags')), ('subscribers',)]))
+        self.assertNotEqual(self.calls[0][0], self.calls[1][0])
+        self.assertTrue(qs._prefetch_done)
+        for obj in qs._result_cache:
+            self.assertEqual(obj._prefetched_objects_cache, {})
+            self.assertEqual(vars(obj._state)['fields_cache'], {})
+
+    def test_sequential(self):
+        for qs in (Blog.objects.prefetch_related('entries', 'subscribers'),
+                   Blog.objects.prefetch_related('entries', 'entries__tags').parallel_prefetch(2)):
+            _, sequential = self.run_prefetch(qs)
+            sequential.assert_called_once()
+        self.assertEqual(self.calls, [])
+
+    def test_option(self):
+        with patch.dict(connection.settings_dict['OPTIONS'], PARALLEL_PREFETCH=2):
+            _, sequential = self.run_prefetch(Blog.objects.prefetch_related('entries', 'subscribers'))
+        sequential.assert_not_called()
+        self.assertEqual(len(self.calls), 2)
@@ -0,0 +1,157 @@
+import unittest
+from unittest.mock import patch
+
+from django.db import connection
+from pymongo import ASCENDING, DESCENDING
+
+from djongo import models
+from djongo.schema import DatabaseSchemaEditor
+from .models import Article, LogEntry, Reading
+from .utils import mock_db
+
+
+class SchemaTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.db = mock_db()
+        connection.connection = self.db
+        self.editor = DatabaseSchemaEditor(connection)
+
+    def tearDown(self):
+        connection.connection = None
+
+    def created_indexes(self, table='tests_article'):
+        return {index.document['name']: index.document
+                for call in self.db[table].create_indexes.call_args_list
+                for index in call[0][0]}
+
+
+class TestIndexes(SchemaTestCase):
+    '''Test cases for the indexes created from fields and Meta options'''
+
+    def test_create_model(self):
+        self.editor.create_model(Article)
+
+        self.db.create_collection.assert_called_once_with('tests_article')
+        self.db['__schema__'].insert_one.assert_called_once_with(
+            {'name': 'tests_article', 'auto': {'field_name': 'id', 'seq': 0}})
+        self.db['tests_article'].create_indexes.assert_called_once()
+
+        indexes = self.created_indexes()
+        self.assertEqual(indexes['id_pk']['key'], {'id': ASCENDING})
+        self.assertTrue(indexes['id_pk']['unique'])
+        self.assertEqual(indexes['slug_uniq']['partialFilterExpression'],
+                         {'slug': {'$type': 'string'}})
+        self.assertNotIn('unique', indexes['author_idx'])
+        self.assertEqual(indexes['author_published_uniq']['key'],
+                         {'author': ASCENDING, 'published': ASCENDING})
+        self.assertEqual(indexes['published_desc']['key'], {'published': DESCENDING})
+        self.assertEqual(indexes['author_hashed']['key'], {'author': 'hashed'})
+        self.assertTrue(all(index['background'] for index in indexes.values()))
+
+    def test_add_remove_index(self):
+        index = models.MongoIndex(fields=['published'], name='published_ttl',
+                                  expire_after_seconds=3600)
+        self.editor.add_index(Article, index)
+        self.assertEqual(self.created_indexes()['published_ttl']['expireAfterSeconds'], 3600)
+
+        self.editor.remove_index(Article, index)
+        self.db['tests_article'].drop_index.assert_called_once_with('published_ttl')
+
+    def test_alter_unique_together(self):
+        self.editor.alter_unique_together(Article, [('author', 'published')], [('slug', 'author')])
+        self.db['tests_article'].drop_index.assert_called_once_with('author_published_uniq')
+        self.assertEqual(list(self.created_indexes()), ['slug_author_uniq'])
+
+
+class TestCollectionOptions(SchemaTestCase):
+    '''Test cases for the time-series and capped Meta options'''
+
+    def test_timeseries(self):
+        self.editor.create_model(Reading)
+        self.db.create_collection.assert_called_once_with('tests_reading', timeseries={
+            'timeField': 'taken', 'metaField': 'sensor', 'granularity': 'hours'},
+            expireAfterSeconds=86400)
+
+    def test_timeseries_no_unique_indexes(self):
+        self.editor.create_model(Reading)
+        indexes = self.created_indexes('tests_reading')
+        self.assertEqual(list(indexes), ['value_idx'])
+        self.assertNotIn('unique', indexes['value_idx'])
+
+    def test_capped(self):
+        self.editor.create_model(LogEntry)
+        self.db.create_collection.assert_called_once_with(
+            'tests_logentry', capped=True, size=4096, max=100)
+
+    def test_timeseries_and_capped(self):
+        with patch.object(Reading._meta, 'capped', {'size': 4096}, create=True):
+            with self.assertRaises(ValueError):
+                self.editor.create_model(Reading)
+        self.db.create_collection.assert_not_called()
+
+
+class TestDataMigrations(SchemaTestCase):
+    '''Test cases for the documents rewritten by field and table changes'''
+
+    def setUp(self):
+        super().setUp()
+        coll = self.db['tests_article']
+        coll.find.return_value.sort.return_value.limit.side_effect = [
+            [{'_id': 1}, {'_id': 2}], [{'_id': 3}]]
+        coll.update_many.return_value.matched_count = 2
+        self.options = connection.settings_dict.get('OPTIONS', {})
+        connection.settings_dict['OPTIONS'] = {'MIGRATION_CHUNKS': {'batch_size': 2}}
+
+    def tearDown(self):
+        super().tearDown()
+        connection.settings_dict['OPTIONS'] = self.options
+
+    def updates(self):
+        return [call[0] for call in self.db['tests_article'].update_many.call_args_list]
+
+    def test_add_field(self):
+        field = models.IntegerField(default=5)
+        field.set_attributes_from_name('rating')
+        self.editor.add_field(Article, field)
+
+        self.assertEqual(self.updates(), [
+            ({'$and': [{'_id': {'$in': [1, 2]}}, {'rating': {'$exists': False}}]},
+             {'$set': {'rating': 5}}),
+            ({'$and': [{'_id': {'$in': [3]}}, {'rating': {'$exists': False}}]},
+             {'$set': {'rating': 5}}),
+        ])
+        self.assertEqual(self.db['tests_article'].find.call_args_list[1][0][0],
+                         {'$and': [{'rating': {'$exists': False}}, {'_id': {'$gt': 2}}]})
+
+    def test_remove_field(self):
+        self.editor.remove_field(Article, Article._meta.get_field('views'))
+        self.assertEqual(self.updates()[0][1], {'$unset': {'views': ''}})
+        self.assertEqual(len(self.updates()), 2)
+
+    def test_alter_field(self):
+        self.db['tests_article'].find.return_value.sort.return_value.limit.side_effect = [
+            [{'_id': 1}], [{'_id': 1}]]
+        new_field = models.CharField(max_length=10, default='0')
+        new_field.set_attributes_from_name('view_count')
+        self.editor.alter_field(Article, Article._meta.get_field('views'), new_field)
+
+        rename, convert = self.updates()
+        self.assertEqual(rename[1], {'$rename': {'views': 'view_count'}})
+        self.assertEqual(convert[1], [{'$set': {'view_count': {'$convert': {
+            'input': '$view_count', 'to': 'string', 'onError': '$view_count', 'onNull': None}}}}])
+
+    def test_alter_db_table(self):
+        self.editor.alter_db_table(Article, 'tests_article', 'tests_post_article')
+        self.db['tests_article'].rename.assert_called_once_with('tests_post_article')
+        self.db['__schema__'].update_many.assert_called_once_with(
+            {'name': 'tests_article'}, {'$set': {'name': 'tests_post_article'}})
+
+    def test_delete_model(self):
+        self.editor.delete_model(Article)
+        self.db.drop_collection.assert_called_once_with('tests_article')
+        self.db['__schema__'].delete_many.assert_called_once_with({'name': 'tests_article'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,22 @@
+from collections import defaultdict
+from unittest.mock import MagicMock
+
+
+def mock_db():
+    """
+    A MagicMock database returning a distinct collection per name.
+    """
+    db = MagicMock()
+    collections = defaultdict(MagicMock)
+    db.__getitem__.side_effect = lambda name: collections[name]
+    return db
+
+
+def mock_client():
+    """
+    A MagicMock client returning a distinct mock_db() per name.
+    """
+    client = MagicMock()
+    databases = defaultdict(mock_db)
+    client.__getitem__.side_effect = lambda name: databases[name]
+    return client